@@ -1,5 +1,6 @@
 from flask import Flask
 from dotenv import load_dotenv
+import atexit
 import os
 
 # Load environment variables
@@ -8,6 +9,10 @@ load_dotenv()
 def create_app():
     app = Flask(__name__)
     
+    # Serialize JSON responses with orjson
+    from utils.json_provider import ORJSONProvider
+    app.json = ORJSONProvider(app)
+    
     # Load configuration
     from config.config import Config
     app.config.from_object(Config)
@@ -15,6 +20,36 @@ def create_app():
     # Create upload directory
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    # Database connection lifecycle
+    from config.database import init_app as init_database
+    init_database(app)
+    
+    # Shared services, built once so OCR/LLM clients are not recreated per request.
+    # Controllers look them up here on every call. They are not changed after this point, and the
+    # parts with shared state are thread safe: the lru_cache, the Tesseract semaphore, the LLM batcher
+    # queue and the HTTP connection pools. That makes them safe under gunicorn threads or gevent.
+    from services.file_processing_service import FileProcessingService
+    from services.batch_processing_service import BatchProcessingService
+    file_service = FileProcessingService(
+        app.config['UPLOAD_FOLDER'], app.config.get('TESSERACT_CMD'),
+        llm_batch_size=app.config.get('LLM_BATCH_SIZE', 1),
+        llm_batch_wait_ms=app.config.get('LLM_BATCH_WAIT_MS', 50),
+        llm_batch_concurrency=app.config.get('LLM_BATCH_CONCURRENCY', 4)
+    )
+    app.extensions['file_service'] = file_service
+    # The services live as long as the process, close their HTTP connection pools on shutdown
+    atexit.register(file_service.close)
+    app.extensions['batch_service'] = BatchProcessingService(
+        os.path.dirname(os.path.abspath(__file__)),
+        file_service=file_service,
+        unsafe_writes=app.config.get('BATCH_UNSAFE_MODE', False),
+        max_workers=app.config.get('BATCH_WORKERS'),
+        tesseract_cmd=app.config.get('TESSERACT_CMD'),
+        executor=app.config.get('BATCH_EXECUTOR', 'thread')
+    )
+    from services.batch_job_service import BatchJobService
+    app.extensions['batch_jobs'] = BatchJobService(app)
+    
     # Register blueprints
     from routes.receipt_routes import receipt_bp
     from routes.upload_routes import upload_bp
@@ -46,6 +81,7 @@ def create_app():
                 'batch_discover': '/api/batch/discover',
                 'batch_process': '/api/batch/process',
                 'batch_upload': '/api/batch/upload',
+                'batch_job': '/api/batch/jobs/{id}',
                 'batch_stats': '/api/batch/stats'
             }
         }
@@ -58,4 +94,8 @@ def create_app():
 
 if __name__ == '__main__':
     app = create_app()
+    # Gunicorn does this in its on_starting hook, once for all workers
+    with app.app_context():
+        from services.batch_job_service import BatchJobService
+        BatchJobService.fail_interrupted_jobs()
     app.run(debug=True, host='0.0.0.0', port=5000)
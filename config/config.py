@@ -10,6 +10,32 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', 'receipts')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf'}
+    # First page JPEGs of PDFs without embedded text, sent to the vision models instead of the whole file
+    PREVIEW_FOLDER = os.environ.get('PREVIEW_FOLDER') or os.path.join(UPLOAD_FOLDER, 'previews')
+    PREVIEW_DPI = int(os.environ.get('PREVIEW_DPI', 150))
+    
+    # Batch settings
+    # Skip fsync while bulk ingesting PDFs (they can be re-ingested)
+    BATCH_UNSAFE_MODE = os.environ.get('BATCH_UNSAFE_MODE', 'false').lower() == 'true'
+    # Workers for batch PDF extraction (default: one per CPU core)
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 0)) or None
+    # 'thread' pipeline sharing the app's LLM clients and request batching (extraction waits on LLM APIs),
+    # 'process' pool only for CPU bound deployments, each worker builds its own services
+    BATCH_EXECUTOR = os.environ.get('BATCH_EXECUTOR', 'thread')
+    
+    # LLM request batching: concurrent extractions are sent together, up to this many PDFs per request
+    LLM_BATCH_SIZE = int(os.environ.get('LLM_BATCH_SIZE', 1))  # 1 disables batching
+    LLM_BATCH_WAIT_MS = int(os.environ.get('LLM_BATCH_WAIT_MS', 50))
+    LLM_BATCH_CONCURRENCY = int(os.environ.get('LLM_BATCH_CONCURRENCY', 4))  # batched requests in flight
+    
+    # LLM results cached by prompt and document content, an empty path disables the cache
+    LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', 'llm_cache.db')
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))  # 7 days
+    
+    # Providers are tried in turn, the next one starts if no result arrived within the hedge delay
+    LLM_HEDGE_DELAY_MS = int(os.environ.get('LLM_HEDGE_DELAY_MS', 2000))
+    # Requests in flight per provider, to stay under its rate limits
+    LLM_PROVIDER_CONCURRENCY = int(os.environ.get('LLM_PROVIDER_CONCURRENCY', 8))
     
     # OCR settings
     TESSERACT_CMD = os.environ.get('TESSERACT_CMD') or r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
@@ -21,4 +47,5 @@ class Config:
     GOOGLE_VISION_API_KEY = os.environ.get('GOOLGE_VISION_API_KEY')
     
     # API settings
-    JSONIFY_PRETTYPRINT_REGULAR = True
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    MAX_JSON_LENGTH = int(os.environ.get('MAX_JSON_LENGTH', 64 * 1024))  # 64KB max JSON body
@@ -1,24 +1,260 @@
 import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
 import os
-from flask import current_app
+import logging
+from flask import current_app, g, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Ids are stored as 16-byte blobs in UUID columns and read back as uuid.UUID
+sqlite3.register_adapter(uuid.UUID, lambda value: value.bytes)
+sqlite3.register_converter('UUID', lambda value: uuid.UUID(bytes=value))
+
+# Applied once per physical connection when it is opened
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-64000',
+)
+
+# Bulk ingest can rebuild from the source PDFs, so per-transaction durability is dropped.
+# The journal stays in WAL: changing journal_mode needs exclusive access to the database
+BULK_SYNCHRONOUS = 0  # OFF
+
+# Restores the online default from CONNECTION_PRAGMAS after bulk ingest
+ONLINE_SYNCHRONOUS = 1  # NORMAL
+
+# Prepared statements kept per connection, keyed by SQL text. Covers the fixed repository
+# statements plus the lru_cache'd per-field-set receipt UPSERT/UPDATE variants
+STATEMENT_CACHE_SIZE = 512
+
+# Rows per executemany/IN chunk, well under SQLite's default 999 host parameter limit
+BULK_CHUNK_SIZE = 500
+
+# Idempotent schema bootstrap, mirrors models/receipt.py and models/receipt_file.py
+SCHEMA_STATEMENTS = (
+    '''CREATE TABLE IF NOT EXISTS receipt_file (
+        id UUID BLOB NOT NULL PRIMARY KEY,
+        file_name VARCHAR(255) NOT NULL,
+        file_path VARCHAR(500) NOT NULL,
+        is_valid BOOLEAN NOT NULL DEFAULT FALSE,
+        invalid_reason TEXT,
+        is_processed BOOLEAN NOT NULL DEFAULT FALSE,
+        validated_mtime INTEGER,
+        validated_size INTEGER,
+        content_hash CHAR(32),
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS receipt (
+        id UUID BLOB NOT NULL PRIMARY KEY,
+        purchased_at DATETIME,
+        merchant_name VARCHAR(255),
+        total_amount NUMERIC(10, 2),
+        file_path VARCHAR(500) NOT NULL,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        file_id UUID BLOB NOT NULL REFERENCES receipt_file (id),
+        tax_amount NUMERIC(10, 2),
+        subtotal NUMERIC(10, 2),
+        payment_method VARCHAR(100),
+        raw_text TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS batch_job (
+        id UUID BLOB NOT NULL PRIMARY KEY,
+        kind VARCHAR(20) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        result TEXT,
+        error TEXT,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )''',
+    # Unique keys used by the repository UPSERTs (also added to databases created earlier)
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_receipt_file_name ON receipt_file (file_name)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_receipt_file_id ON receipt (file_id)',
+)
+
+# Columns added after the tables were first created, {table: {column: definition}}
+ADDED_COLUMNS = {
+    'receipt_file': {
+        # os.stat() st_mtime_ns/st_size of the file when is_valid was recorded
+        'validated_mtime': 'INTEGER',
+        'validated_size': 'INTEGER',
+        # blake2b-128 hex digest of uploaded files, to skip extracting the same content twice
+        'content_hash': 'CHAR(32)',
+    },
+}
+
+# Full-text index on merchant names (external content, kept in sync by triggers)
+FTS_STATEMENTS = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS receipt_fts USING fts5(
+        merchant_name, content='receipt', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS receipt_fts_insert AFTER INSERT ON receipt BEGIN
+        INSERT INTO receipt_fts (rowid, merchant_name) VALUES (new.rowid, new.merchant_name);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS receipt_fts_delete AFTER DELETE ON receipt BEGIN
+        INSERT INTO receipt_fts (receipt_fts, rowid, merchant_name) VALUES ('delete', old.rowid, old.merchant_name);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS receipt_fts_update AFTER UPDATE OF merchant_name ON receipt BEGIN
+        INSERT INTO receipt_fts (receipt_fts, rowid, merchant_name) VALUES ('delete', old.rowid, old.merchant_name);
+        INSERT INTO receipt_fts (rowid, merchant_name) VALUES (new.rowid, new.merchant_name);
+    END''',
+)
+
+# Non-unique read path indexes per table, {name: create statement}
+SECONDARY_INDEXES = {
+    'receipt': {
+        'ix_receipt_created_at': 'CREATE INDEX IF NOT EXISTS ix_receipt_created_at ON receipt (created_at DESC, id DESC)',
+        'ix_receipt_merchant': 'CREATE INDEX IF NOT EXISTS ix_receipt_merchant ON receipt (merchant_name COLLATE NOCASE)',
+    },
+    'receipt_file': {
+        'ix_receipt_file_content_hash': 'CREATE INDEX IF NOT EXISTS ix_receipt_file_content_hash ON receipt_file (content_hash)',
+    },
+}
+
+# Connections for code running outside a Flask app context (batch workers, scripts)
+_thread_local = threading.local()
+
+def _get_db_path():
+    """Resolve the SQLite file path from the configured database URI"""
+    if has_app_context():
+        database_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+    else:
+        from config.config import Config
+        database_uri = Config.SQLALCHEMY_DATABASE_URI
+    return database_uri.replace('sqlite:///', '')
+
+def _connect():
+    """Open a new SQLite connection and apply the connection pragmas"""
+    conn = sqlite3.connect(
+        _get_db_path(), detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=STATEMENT_CACHE_SIZE
+    )
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
 
 def get_db_connection():
-    """Get SQLite database connection"""
-    db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    """
+    Get SQLite database connection
+    Reuses one connection per app context, or per thread outside of Flask
+    """
+    if has_app_context():
+        if '_db' not in g:
+            g._db = _connect()
+        return g._db
+
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _thread_local.conn = conn
     return conn
 
+def fetch_one(cursor: sqlite3.Cursor) -> Optional[Dict[str, Any]]:
+    """Fetch the next row of an executed cursor as a dict"""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+def fetch_all(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """Fetch the remaining rows of an executed cursor as dicts"""
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def close_db_connection(exception=None):
+    """Close the app context connection (registered on teardown_appcontext)"""
+    conn = g.pop('_db', None)
+    if conn is not None:
+        conn.close()
+
+def close_thread_connection():
+    """Close the connection owned by the current thread, if any"""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _thread_local.conn = None
+
+def _set_synchronous(conn, level: int) -> bool:
+    """Set the synchronous level of a connection, returns whether SQLite applied it"""
+    try:
+        conn.execute(f'PRAGMA synchronous={level}')
+        return conn.execute('PRAGMA synchronous').fetchone()[0] == level
+    except sqlite3.OperationalError as e:
+        logger.warning("Could not set PRAGMA synchronous=%s: %s", level, e)
+        return False
+
+@contextmanager
+def bulk_write_mode(enabled: bool = True):
+    """
+    Turn off fsync on the current connection for the duration of the block
+    Best effort: if SQLite refuses the pragma the block runs with the online settings
+    """
+    if not enabled:
+        yield
+        return
+    
+    conn = get_db_connection()
+    applied = _set_synchronous(conn, BULK_SYNCHRONOUS)
+    try:
+        yield
+    finally:
+        if applied:
+            _set_synchronous(conn, ONLINE_SYNCHRONOUS)
+
+def create_secondary_indexes(conn, table: str):
+    """Create the non-unique indexes of a table"""
+    for statement in SECONDARY_INDEXES.get(table, {}).values():
+        conn.execute(statement)
+
+def ensure_schema():
+    """Create missing tables and indexes"""
+    conn = get_db_connection()
+    with conn:
+        for statement in SCHEMA_STATEMENTS:
+            conn.execute(statement)
+        for table, columns in ADDED_COLUMNS.items():
+            existing_columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for column, definition in columns.items():
+                if column not in existing_columns:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        for table in SECONDARY_INDEXES:
+            create_secondary_indexes(conn, table)
+        
+        # Index receipts stored before the full-text table existed
+        fts_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'receipt_fts'"
+        ).fetchone()
+        for statement in FTS_STATEMENTS:
+            conn.execute(statement)
+        if not fts_exists:
+            conn.execute("INSERT INTO receipt_fts (receipt_fts) VALUES ('rebuild')")
+
+def init_app(app):
+    """Register database connection lifecycle and schema commands with the Flask app"""
+    app.teardown_appcontext(close_db_connection)
+    app.cli.command('init-db')(init_db)
+    app.cli.command('reset-db')(reset_db)
+    
+    with app.app_context():
+        ensure_schema()
+
 def init_db():
-    """Initialize database with tables"""
-    from app import db
-    db.create_all()
+    """Initialize database with tables (the raw schema declares the UUID columns the repositories rely on)"""
+    ensure_schema()
     print("Database tables created successfully!")
 
 def drop_db():
     """Drop all tables"""
-    from app import db
-    db.drop_all()
+    conn = get_db_connection()
+    with conn:
+        for table in ('batch_job', 'receipt_fts', 'receipt', 'receipt_file'):
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
     print("Database tables dropped!")
 
 def reset_db():
@@ -1,28 +1,53 @@
-from flask import jsonify, current_app
-from services.batch_processing_service import BatchProcessingService
+from flask import jsonify, current_app, request
+from repositories.batch_job_repository import BatchJobRepository
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
+def _summarize(results):
+    """Response body of a finished batch run"""
+    return {
+        'summary': {
+            'total_files': results['total_files'],
+            'processed': results['processed'],
+            'failed': results['failed'],
+            'skipped': results['skipped']
+        },
+        'details': results['details']
+    }
+
 class BatchController:
     """Controller for batch processing existing PDF files"""
     
-    def __init__(self):
-        self.batch_service = None
-    
     def _get_batch_service(self):
-        """Get batch processing service instance"""
-        if self.batch_service is None:
-            # Use the project root directory for discovering PDFs
-            base_directory = os.path.dirname(os.path.dirname(__file__))
-            self.batch_service = BatchProcessingService(base_directory)
-        return self.batch_service
+        """Get the batch processing service shared by the app"""
+        return current_app.extensions['batch_service']
+    
+    def _wait_requested(self):
+        """?wait=true runs the batch inside the request instead of queueing a job"""
+        return request.args.get('wait', 'false').lower() == 'true'
+    
+    def _queued(self, job):
+        """202 response pointing at the job status endpoint"""
+        return jsonify({
+            'message': 'Batch processing queued',
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/api/batch/jobs/{job['id']}"
+        }), 202
     
     def discover_files(self):
-        """Discover all PDF files in directory structure"""
+        """Discover all PDF files in directory structure, listing them only with ?list=true"""
         try:
             batch_service = self._get_batch_service()
+            
+            if request.args.get('list', 'false').lower() != 'true':
+                total_files = sum(1 for _ in batch_service.iter_pdf_files())
+                return jsonify({
+                    'message': f'Found {total_files} PDF files',
+                    'total_files': total_files
+                }), 200
+            
             pdf_files = batch_service.discover_pdf_files()
             
             return jsonify({
@@ -36,21 +61,18 @@ class BatchController:
             return jsonify({'error': 'Failed to discover files'}), 500
     
     def process_all_files(self):
-        """Process all discovered PDF files"""
+        """Queue processing of all discovered PDF files (processed in the request with ?wait=true)"""
         try:
             batch_service = self._get_batch_service()
-            results = batch_service.process_all_pdfs()
             
-            return jsonify({
-                'message': 'Batch processing completed',
-                'summary': {
-                    'total_files': results['total_files'],
-                    'processed': results['processed'],
-                    'failed': results['failed'],
-                    'skipped': results['skipped']
-                },
-                'details': results['details']
-            }), 200
+            if self._wait_requested():
+                results = batch_service.process_all_pdfs()
+                return jsonify({'message': 'Batch processing completed', **_summarize(results)}), 200
+            
+            job = current_app.extensions['batch_jobs'].submit(
+                'process', lambda: _summarize(batch_service.process_all_pdfs())
+            )
+            return self._queued(job)
             
         except Exception as e:
             logger.error(f"Batch processing error: {str(e)}")
@@ -70,10 +92,21 @@ class BatchController:
             logger.error(f"Stats retrieval error: {str(e)}")
             return jsonify({'error': 'Failed to get statistics'}), 500
     
+    def get_job(self, job_id):
+        """Get the status of a batch job, with its summary and details once completed"""
+        try:
+            job = BatchJobRepository.get_by_id(job_id)
+            if not job:
+                return jsonify({'error': 'Job not found'}), 404
+            
+            return jsonify({'job': job}), 200
+            
+        except Exception as e:
+            logger.error(f"Job retrieval error: {str(e)}")
+            return jsonify({'error': 'Failed to get job'}), 500
+    
     def batch_upload(self):
-        """Upload and process multiple PDF files"""
-        from flask import request
-        
+        """Upload multiple PDF files and queue their processing (processed in the request with ?wait=true)"""
         try:
             if 'files' not in request.files:
                 return jsonify({'error': 'No files provided'}), 400
@@ -83,18 +116,22 @@ class BatchController:
                 return jsonify({'error': 'No files selected'}), 400
             
             batch_service = self._get_batch_service()
-            results = batch_service.process_uploaded_files(files)
             
-            return jsonify({
-                'message': 'Batch upload completed',
-                'summary': {
-                    'total_files': results['total_files'],
-                    'processed': results['processed'],
-                    'failed': results['failed'],
-                    'skipped': results['skipped']
-                },
-                'details': results['details']
-            }), 200
+            if self._wait_requested():
+                results = batch_service.process_uploaded_files(files)
+                return jsonify({'message': 'Batch upload completed', **_summarize(results)}), 200
+            
+            # The uploads are only readable while the request is open, extraction runs afterwards
+            results, pending_files = batch_service.save_uploaded_files(files)
+            if not pending_files:
+                # Every file was skipped or failed to save, there is nothing to extract
+                results = batch_service.extract_saved_files(results, pending_files)
+                return jsonify({'message': 'Batch upload completed', **_summarize(results)}), 200
+            
+            job = current_app.extensions['batch_jobs'].submit(
+                'upload', lambda: _summarize(batch_service.extract_saved_files(results, pending_files))
+            )
+            return self._queued(job)
             
         except Exception as e:
             logger.error(f"Batch upload error: {str(e)}")
@@ -1,21 +1,73 @@
-from flask import jsonify, request
+from flask import jsonify, request, current_app, Response, stream_with_context
 from repositories.receipt_repository import ReceiptRepository
 from repositories.receipt_file_repository import ReceiptFileRepository
+import hashlib
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Clients polling receipts may reuse a response for this many seconds
+CACHE_MAX_AGE = 5
+
+def _etag(*parts: bytes) -> str:
+    """
+    Weak validator hashing the serialized response content
+    (updated_at only has one second resolution, so an edit within the same second would keep it)
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(part)
+    return digest.hexdigest()
+
+def _cacheable(response: Response, etag: str) -> Response:
+    """Attach the ETag and short private caching headers"""
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.max_age = CACHE_MAX_AGE
+    return response
+
+def _not_modified(etag: str):
+    """304 response when the client already holds this ETag, else None"""
+    if request.if_none_match.contains_weak(etag):
+        return _cacheable(Response(status=304), etag)
+    return None
+
 class ReceiptController:
     
     def get_all_receipts(self):
-        """Get all receipts endpoint"""
+        """Get a page of receipts endpoint"""
         try:
-            receipts = ReceiptRepository.get_all()
-            
-            return jsonify({
-                'receipts': receipts,
-                'total': len(receipts)
-            }), 200
+            cursor = request.args.get('cursor')
+            limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            
+            try:
+                receipts, next_cursor = ReceiptRepository.get_page(cursor, limit)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            
+            # Rows are serialized once, for the ETag and the body
+            rows = [orjson.dumps(receipt) for receipt in receipts]
+            next_cursor_json = orjson.dumps(next_cursor)
+            etag = _etag(next_cursor_json, *rows)
+            not_modified = _not_modified(etag)
+            if not_modified:
+                return not_modified
+            
+            def generate():
+                # Stream row by row instead of joining the whole document
+                yield b'{"receipts":['
+                for index, row in enumerate(rows):
+                    if index:
+                        yield b','
+                    yield row
+                yield b'],"total":%d,"next_cursor":%s}' % (len(rows), next_cursor_json)
+            
+            return _cacheable(Response(stream_with_context(generate()), mimetype='application/json'), etag), 200
             
         except Exception as e:
             logger.error(f"Get receipts error: {str(e)}")
@@ -35,7 +87,13 @@ class ReceiptController:
             if receipt_file:
                 receipt['file_info'] = receipt_file
             
-            return jsonify({'receipt': receipt}), 200
+            body = current_app.json.dumps({'receipt': receipt}).encode('utf-8')
+            etag = _etag(body)
+            not_modified = _not_modified(etag)
+            if not_modified:
+                return not_modified
+            
+            return _cacheable(Response(body, mimetype='application/json'), etag), 200
             
         except Exception as e:
             logger.error(f"Get receipt error: {str(e)}")
@@ -44,7 +102,10 @@ class ReceiptController:
     def update_receipt(self, receipt_id):
         """Update receipt endpoint"""
         try:
-            data = request.get_json()
+            if (request.content_length or 0) > current_app.config['MAX_JSON_LENGTH']:
+                return jsonify({'error': 'Payload too large'}), 413
+            
+            data = request.get_json(silent=True, cache=False)
             
             if not data:
                 return jsonify({'error': 'No data provided'}), 400
@@ -1,5 +1,4 @@
 from flask import request, jsonify, current_app
-from services.file_processing_service import FileProcessingService
 from repositories.receipt_file_repository import ReceiptFileRepository
 import logging
 
@@ -7,17 +6,9 @@ logger = logging.getLogger(__name__)
 
 class UploadController:
     
-    def __init__(self):
-        self.file_service = None
-    
     def _get_file_service(self):
-        """Get file processing service instance"""
-        if self.file_service is None:
-            self.file_service = FileProcessingService(
-                current_app.config['UPLOAD_FOLDER'],
-                current_app.config.get('TESSERACT_CMD')
-            )
-        return self.file_service
+        """Get the file processing service shared by the app"""
+        return current_app.extensions['file_service']
     
     def upload_file(self):
         """Upload receipt file endpoint"""
@@ -59,7 +50,10 @@ class UploadController:
     def validate_file(self):
         """Validate PDF file endpoint"""
         try:
-            data = request.get_json()
+            if (request.content_length or 0) > current_app.config['MAX_JSON_LENGTH']:
+                return jsonify({'error': 'Payload too large'}), 413
+            
+            data = request.get_json(silent=True, cache=False)
             
             if not data or 'file_id' not in data:
                 return jsonify({'error': 'file_id is required'}), 400
@@ -73,13 +67,14 @@ class UploadController:
                 return jsonify({'error': 'File not found'}), 404
             
             # Validate file using file path, not file ID
-            is_valid, message = file_service.validate_file(receipt_file['file_path'])
+            file_path = receipt_file['file_path']
+            signature = file_service.file_signature(file_path)
+            is_valid, message = file_service.validate_file(file_path)
             
-            # Update the file record with validation results
-            ReceiptFileRepository.update_validation(file_id, is_valid, message if not is_valid else None)
-            
-            # Get updated file record
-            updated_receipt_file = ReceiptFileRepository.get_by_id(file_id)
+            # Update the file record with validation results, the updated row is returned
+            updated_receipt_file = ReceiptFileRepository.update_validation(
+                file_id, is_valid, message if not is_valid else None, signature
+            )
             
             return jsonify({
                 'message': message,
@@ -94,7 +89,10 @@ class UploadController:
     def process_file(self):
         """Process file with OCR endpoint"""
         try:
-            data = request.get_json()
+            if (request.content_length or 0) > current_app.config['MAX_JSON_LENGTH']:
+                return jsonify({'error': 'Payload too large'}), 413
+            
+            data = request.get_json(silent=True, cache=False)
             
             if not data or 'file_id' not in data:
                 return jsonify({'error': 'file_id is required'}), 400
@@ -0,0 +1,25 @@
+# Gunicorn settings for serving the API
+# Usage: gunicorn -c gunicorn.conf.py "app:create_app()"
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+# gevent workers monkey-patch the stdlib before the app is imported, so blocking
+# socket/file I/O in uploads and LLM calls yields to other requests
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Batch processing requests can run for minutes
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 600))
+
+def on_starting(server):
+    """Fail batch jobs a previous server left queued or running, before any worker can start one"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    from config.database import ensure_schema, close_thread_connection
+    from services.batch_job_service import BatchJobService
+    ensure_schema()
+    BatchJobService.fail_interrupted_jobs()
+    # Workers are forked from this process, they must not inherit its connection
+    close_thread_connection()
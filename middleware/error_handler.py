@@ -1,28 +1,36 @@
-from flask import jsonify
+from flask import Response
+from werkzeug.exceptions import HTTPException
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Error bodies are encoded once at import, keyed by status code
+_INTERNAL_ERROR = b'{"error":"Internal server error"}'
+_ERROR_BODIES = {
+    400: b'{"error":"Bad request"}',
+    404: b'{"error":"Resource not found"}',
+    413: b'{"error":"File too large"}',
+    500: _INTERNAL_ERROR,
+}
+
+def _error_response(body: bytes, status: int) -> Response:
+    """Wrap a precomputed JSON body (a fresh Response, since after_request hooks may mutate it)"""
+    return Response(body, status=status, mimetype='application/json')
+
 def register_error_handlers(app):
     
-    @app.errorhandler(400)
-    def bad_request(error):
-        return jsonify({'error': 'Bad request'}), 400
-    
-    @app.errorhandler(404)
-    def not_found(error):
-        return jsonify({'error': 'Resource not found'}), 404
-    
-    @app.errorhandler(413)
-    def file_too_large(error):
-        return jsonify({'error': 'File too large'}), 413
-    
-    @app.errorhandler(500)
-    def internal_error(error):
-        logger.error(f"Internal server error: {str(error)}")
-        return jsonify({'error': 'Internal server error'}), 500
+    @app.errorhandler(HTTPException)
+    def handle_http_exception(error):
+        body = _ERROR_BODIES.get(error.code)
+        if body is None:
+            # Other HTTP errors (405, 415, ...) keep Werkzeug's own response
+            return error
+        
+        if error.code == 500:
+            logger.error(f"Internal server error: {str(error)}")
+        return _error_response(body, error.code)
     
     @app.errorhandler(Exception)
     def handle_exception(e):
         logger.error(f"Unhandled exception: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return _error_response(_INTERNAL_ERROR, 500)
@@ -1 +1,8 @@
 # Models module
+from flask_sqlalchemy import SQLAlchemy
+
+# Shared by every model so they register on one metadata
+db = SQLAlchemy()
+
+from models.receipt_file import ReceiptFile
+from models.receipt import Receipt
@@ -1,13 +1,13 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import uuid
-
-db = SQLAlchemy()
+from utils.helpers import uuid7
+from models import db
 
 class Receipt(db.Model):
     __tablename__ = 'receipt'
     
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    # 16-byte time-ordered UUIDs, see config/database.py
+    id = db.Column(db.LargeBinary(16), primary_key=True, default=lambda: uuid7().bytes)
     purchased_at = db.Column(db.DateTime, nullable=True)
     merchant_name = db.Column(db.String(255), nullable=True)
     total_amount = db.Column(db.Numeric(10, 2), nullable=True)
@@ -16,7 +16,7 @@ class Receipt(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Foreign key to receipt_file
-    file_id = db.Column(db.String, db.ForeignKey('receipt_file.id'), nullable=False)
+    file_id = db.Column(db.LargeBinary(16), db.ForeignKey('receipt_file.id'), unique=True, nullable=False)
     
     # Additional fields for enhanced extraction
     tax_amount = db.Column(db.Numeric(10, 2), nullable=True)
@@ -26,7 +26,7 @@ class Receipt(db.Model):
     
     def to_dict(self):
         return {
-            'id': self.id,
+            'id': str(uuid.UUID(bytes=self.id)) if self.id else None,
             'purchased_at': self.purchased_at.isoformat() if self.purchased_at else None,
             'merchant_name': self.merchant_name,
             'total_amount': float(self.total_amount) if self.total_amount else None,
@@ -34,7 +34,7 @@ class Receipt(db.Model):
             'subtotal': float(self.subtotal) if self.subtotal else None,
             'payment_method': self.payment_method,
             'file_path': self.file_path,
-            'file_id': self.file_id,
+            'file_id': str(uuid.UUID(bytes=self.file_id)) if self.file_id else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
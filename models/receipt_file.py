@@ -1,18 +1,21 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import uuid
-
-db = SQLAlchemy()
+from utils.helpers import uuid7
+from models import db
 
 class ReceiptFile(db.Model):
     __tablename__ = 'receipt_file'
     
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    file_name = db.Column(db.String(255), nullable=False)
+    # 16-byte time-ordered UUIDs, see config/database.py
+    id = db.Column(db.LargeBinary(16), primary_key=True, default=lambda: uuid7().bytes)
+    file_name = db.Column(db.String(255), unique=True, nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     is_valid = db.Column(db.Boolean, default=False, nullable=False)
     invalid_reason = db.Column(db.Text, nullable=True)
     is_processed = db.Column(db.Boolean, default=False, nullable=False)
+    validated_mtime = db.Column(db.Integer, nullable=True)
+    validated_size = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(32), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
@@ -21,12 +24,15 @@ class ReceiptFile(db.Model):
     
     def to_dict(self):
         return {
-            'id': self.id,
+            'id': str(uuid.UUID(bytes=self.id)) if self.id else None,
             'file_name': self.file_name,
             'file_path': self.file_path,
             'is_valid': self.is_valid,
             'invalid_reason': self.invalid_reason,
             'is_processed': self.is_processed,
+            'validated_mtime': self.validated_mtime,
+            'validated_size': self.validated_size,
+            'content_hash': self.content_hash,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -0,0 +1,72 @@
+import orjson
+from typing import Optional, Dict, Any
+from config.database import get_db_connection, fetch_one
+from utils.helpers import uuid7, parse_uuid
+
+class BatchJobRepository:
+    """Status of batch runs executed in the background, result holds the JSON summary"""
+    
+    @staticmethod
+    def _decode(job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Parse the stored JSON result of a job row"""
+        if job and job['result'] is not None:
+            job['result'] = orjson.loads(job['result'])
+        return job
+    
+    @staticmethod
+    def create(kind: str) -> Dict[str, Any]:
+        """Create a queued job"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        result = fetch_one(cursor.execute(
+            '''INSERT INTO batch_job (id, kind, status, created_at, updated_at)
+               VALUES (?, ?, 'queued', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+               RETURNING *''',
+            (uuid7(), kind)
+        ))
+        conn.commit()
+        
+        return result
+    
+    @staticmethod
+    def get_by_id(job_id: str) -> Optional[Dict[str, Any]]:
+        """Get job by ID"""
+        conn = get_db_connection()
+        return BatchJobRepository._decode(fetch_one(conn.execute(
+            'SELECT * FROM batch_job WHERE id = ?',
+            (parse_uuid(job_id),)
+        )))
+    
+    @staticmethod
+    def update_status(job_id: str, status: str, result: Any = None, error: str = None) -> Optional[Dict[str, Any]]:
+        """Set the status of a job, with its result once it has finished"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        job = fetch_one(cursor.execute(
+            '''UPDATE batch_job 
+               SET status = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP 
+               WHERE id = ?
+               RETURNING *''',
+            (status, orjson.dumps(result).decode() if result is not None else None, error, parse_uuid(job_id))
+        ))
+        conn.commit()
+        
+        return BatchJobRepository._decode(job)
+    
+    @staticmethod
+    def fail_unfinished(error: str) -> int:
+        """Mark every queued or running job as failed, returns the number of jobs updated"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            '''UPDATE batch_job 
+               SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP 
+               WHERE status IN ('queued', 'running')''',
+            (error,)
+        )
+        conn.commit()
+        
+        return cursor.rowcount
@@ -1,109 +1,161 @@
 import sqlite3
-from typing import List, Optional, Dict, Any
-from config.database import get_db_connection
-import uuid
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from config.database import get_db_connection, fetch_one, fetch_all, BULK_CHUNK_SIZE
+from utils.helpers import chunked, uuid7, parse_uuid
 from datetime import datetime
 
 class ReceiptFileRepository:
     
     @staticmethod
     def create(file_name: str, file_path: str) -> Dict[str, Any]:
-        """Create a new receipt file record"""
+        """Create a new receipt file record, or update the path of an existing one"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check for existing file
-        existing = cursor.execute(
-            'SELECT id FROM receipt_file WHERE file_name = ?', 
-            (file_name,)
-        ).fetchone()
+        result = fetch_one(cursor.execute(
+            '''INSERT INTO receipt_file 
+               (id, file_name, file_path, is_valid, is_processed, created_at, updated_at)
+               VALUES (?, ?, ?, FALSE, FALSE, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+               ON CONFLICT(file_name) DO UPDATE 
+               SET file_path = excluded.file_path, updated_at = CURRENT_TIMESTAMP
+               RETURNING *''',
+            (uuid7(), file_name, file_path)
+        ))
+        conn.commit()
         
-        if existing:
-            # Update existing file
-            cursor.execute(
-                '''UPDATE receipt_file 
-                   SET file_path = ?, updated_at = CURRENT_TIMESTAMP 
-                   WHERE file_name = ?''',
-                (file_path, file_name)
-            )
-            conn.commit()
-            
-            # Get updated record
-            result = cursor.execute(
-                'SELECT * FROM receipt_file WHERE file_name = ?', 
-                (file_name,)
-            ).fetchone()
-        else:
-            # Create new record
-            file_id = str(uuid.uuid4())
-            cursor.execute(
-                '''INSERT INTO receipt_file 
-                   (id, file_name, file_path, is_valid, is_processed, created_at, updated_at)
-                   VALUES (?, ?, ?, FALSE, FALSE, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)''',
-                (file_id, file_name, file_path)
-            )
-            conn.commit()
-            
-            # Get created record
-            result = cursor.execute(
-                'SELECT * FROM receipt_file WHERE id = ?', 
-                (file_id,)
-            ).fetchone()
-        
-        conn.close()
-        return dict(result) if result else None
+        return result
+    
+    @staticmethod
+    def create_many(rows: Iterable[tuple]) -> int:
+        """
+        Create or update many receipt file records in a single transaction
+        rows: (file_name, file_path) or (file_name, file_path, content_hash) tuples
+        Returns: number of rows written
+        """
+        conn = get_db_connection()
+        written = 0
+        
+        with conn:
+            for chunk in chunked(rows, BULK_CHUNK_SIZE):
+                conn.executemany(
+                    '''INSERT INTO receipt_file 
+                       (id, file_name, file_path, content_hash, is_valid, is_processed, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, FALSE, FALSE, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                       ON CONFLICT(file_name) DO UPDATE 
+                       SET file_path = excluded.file_path, 
+                           content_hash = COALESCE(excluded.content_hash, content_hash), 
+                           updated_at = CURRENT_TIMESTAMP''',
+                    [(uuid7(), row[0], row[1], row[2] if len(row) > 2 else None) for row in chunk]
+                )
+                written += len(chunk)
+        
+        return written
     
     @staticmethod
     def get_by_id(file_id: str) -> Optional[Dict[str, Any]]:
         """Get receipt file by ID"""
         conn = get_db_connection()
-        result = conn.execute(
+        return fetch_one(conn.execute(
             'SELECT * FROM receipt_file WHERE id = ?', 
-            (file_id,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+            (parse_uuid(file_id),)
+        ))
     
     @staticmethod
     def get_by_file_name(file_name: str) -> Optional[Dict[str, Any]]:
         """Get receipt file by file name"""
         conn = get_db_connection()
-        result = conn.execute(
+        return fetch_one(conn.execute(
             'SELECT * FROM receipt_file WHERE file_name = ?', 
             (file_name,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+        ))
+    
+    @staticmethod
+    def get_by_file_names(file_names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get receipt files for many file names in one pass, keyed by file name"""
+        conn = get_db_connection()
+        records = {}
+        
+        for chunk in chunked(set(file_names), BULK_CHUNK_SIZE):
+            records.update((record['file_name'], record) for record in fetch_all(conn.execute(
+                f"SELECT * FROM receipt_file WHERE file_name IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )))
+        
+        return records
+    
+    @staticmethod
+    def get_processed_by_content_hashes(content_hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get processed receipt files with any of the given content hashes, keyed by hash"""
+        conn = get_db_connection()
+        records = {}
+        
+        for chunk in chunked(set(content_hashes), BULK_CHUNK_SIZE):
+            for record in fetch_all(conn.execute(
+                f"""SELECT * FROM receipt_file 
+                    WHERE is_processed AND content_hash IN ({', '.join('?' for _ in chunk)})""",
+                chunk
+            )):
+                records.setdefault(record['content_hash'], record)
+        
+        return records
     
     @staticmethod
     def get_all() -> List[Dict[str, Any]]:
         """Get all receipt files"""
         conn = get_db_connection()
-        results = conn.execute('SELECT * FROM receipt_file ORDER BY created_at DESC').fetchall()
-        conn.close()
-        return [dict(row) for row in results]
+        return fetch_all(conn.execute('SELECT * FROM receipt_file ORDER BY created_at DESC'))
     
     @staticmethod
-    def update_validation(file_id: str, is_valid: bool, invalid_reason: str = None) -> Optional[Dict[str, Any]]:
-        """Update validation status"""
+    def count_stats() -> Dict[str, int]:
+        """Count all, valid and processed receipt files in one query"""
+        conn = get_db_connection()
+        total, valid, processed = conn.execute(
+            '''SELECT COUNT(*), COUNT(*) FILTER (WHERE is_valid), COUNT(*) FILTER (WHERE is_processed) 
+               FROM receipt_file'''
+        ).fetchone()
+        return {'total': total, 'valid': valid, 'processed': processed}
+    
+    @staticmethod
+    def update_validation(file_id: str, is_valid: bool, invalid_reason: str = None,
+                          signature: Optional[Tuple[int, int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Update validation status
+        signature is the (mtime_ns, size) of the validated file, letting later runs reuse the result
+        """
         conn = get_db_connection()
         cursor = conn.cursor()
+        validated_mtime, validated_size = signature or (None, None)
         
-        cursor.execute(
+        result = fetch_one(cursor.execute(
             '''UPDATE receipt_file 
-               SET is_valid = ?, invalid_reason = ?, updated_at = CURRENT_TIMESTAMP 
-               WHERE id = ?''',
-            (is_valid, invalid_reason, file_id)
-        )
+               SET is_valid = ?, invalid_reason = ?, validated_mtime = ?, validated_size = ?, 
+                   updated_at = CURRENT_TIMESTAMP 
+               WHERE id = ?
+               RETURNING *''',
+            (is_valid, invalid_reason, validated_mtime, validated_size, parse_uuid(file_id))
+        ))
         conn.commit()
         
-        # Get updated record
-        result = cursor.execute(
-            'SELECT * FROM receipt_file WHERE id = ?', 
-            (file_id,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+        return result
+    
+    @staticmethod
+    def update_validation_many(rows: Iterable[tuple]) -> None:
+        """
+        Update the validation status of many files in a single transaction
+        rows: (file_id, is_valid, invalid_reason, signature) tuples, signature as in update_validation
+        """
+        conn = get_db_connection()
+        
+        with conn:
+            for chunk in chunked(rows, BULK_CHUNK_SIZE):
+                conn.executemany(
+                    '''UPDATE receipt_file 
+                       SET is_valid = ?, invalid_reason = ?, validated_mtime = ?, validated_size = ?, 
+                           updated_at = CURRENT_TIMESTAMP 
+                       WHERE id = ?''',
+                    [(is_valid, invalid_reason, *(signature or (None, None)), parse_uuid(file_id))
+                     for file_id, is_valid, invalid_reason, signature in chunk]
+                )
     
     @staticmethod
     def mark_processed(file_id: str) -> Optional[Dict[str, Any]]:
@@ -111,21 +163,31 @@ class ReceiptFileRepository:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute(
+        result = fetch_one(cursor.execute(
             '''UPDATE receipt_file 
                SET is_processed = TRUE, updated_at = CURRENT_TIMESTAMP 
-               WHERE id = ?''',
-            (file_id,)
-        )
+               WHERE id = ?
+               RETURNING *''',
+            (parse_uuid(file_id),)
+        ))
         conn.commit()
         
-        # Get updated record
-        result = cursor.execute(
-            'SELECT * FROM receipt_file WHERE id = ?', 
-            (file_id,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+        return result
+    
+    @staticmethod
+    def mark_processed_many(file_ids: Iterable[str]) -> None:
+        """Mark many validated files as processed in a single transaction"""
+        conn = get_db_connection()
+        
+        with conn:
+            for chunk in chunked(file_ids, BULK_CHUNK_SIZE):
+                conn.executemany(
+                    '''UPDATE receipt_file 
+                       SET is_valid = TRUE, invalid_reason = NULL, is_processed = TRUE, 
+                           updated_at = CURRENT_TIMESTAMP 
+                       WHERE id = ?''',
+                    [(parse_uuid(file_id),) for file_id in chunk]
+                )
     
     @staticmethod
     def delete(file_id: str) -> bool:
@@ -133,9 +195,8 @@ class ReceiptFileRepository:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('DELETE FROM receipt_file WHERE id = ?', (file_id,))
+        cursor.execute('DELETE FROM receipt_file WHERE id = ?', (parse_uuid(file_id),))
         deleted_count = cursor.rowcount
         conn.commit()
-        conn.close()
         
         return deleted_count > 0
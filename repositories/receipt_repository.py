@@ -1,100 +1,181 @@
 import sqlite3
-from typing import List, Optional, Dict, Any
-from config.database import get_db_connection
-import uuid
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from config.database import get_db_connection, fetch_one, fetch_all, BULK_CHUNK_SIZE
+from utils.helpers import chunked, encode_cursor, decode_cursor, uuid7, parse_uuid
 from datetime import datetime
+from functools import lru_cache
+
+# Receipt columns that extracted or user supplied data may set
+_RECEIPT_FIELDS = ('purchased_at', 'merchant_name', 'total_amount', 'tax_amount', 
+                   'subtotal', 'payment_method', 'raw_text')
+_CREATABLE = frozenset(_RECEIPT_FIELDS)
+_UPDATABLE = frozenset(_RECEIPT_FIELDS + ('file_path',))
+
+# Columns returned by listings (raw_text is only loaded for single receipts)
+_LIST_COLUMNS = ', '.join(('id', 'file_id', 'purchased_at', 'merchant_name', 'total_amount', 'tax_amount', 
+                           'subtotal', 'payment_method', 'file_path', 'created_at', 'updated_at'))
+
+# Missing fields keep the value already stored for that file
+_CREATE_MANY_SQL = f'''INSERT INTO receipt 
+    (id, file_id, file_path, {', '.join(_RECEIPT_FIELDS)}, created_at, updated_at)
+    VALUES (?, ?, ?, {', '.join('?' for _ in _RECEIPT_FIELDS)}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT(file_id) DO UPDATE 
+    SET file_path = excluded.file_path, 
+        {', '.join(f"{key} = COALESCE(excluded.{key}, receipt.{key})" for key in _RECEIPT_FIELDS)}, 
+        updated_at = CURRENT_TIMESTAMP'''
+
+@lru_cache(maxsize=128)
+def _create_sql(fields: tuple) -> str:
+    """Build the receipt UPSERT for a sorted tuple of field names"""
+    columns = ('id', 'file_id', 'file_path') + fields
+    update_fields = [f"{key} = excluded.{key}" for key in fields] + ['updated_at = CURRENT_TIMESTAMP']
+    
+    # Existing receipts for this file only get the provided fields updated
+    return f'''INSERT INTO receipt 
+        ({', '.join(columns)}, created_at, updated_at)
+        VALUES ({', '.join('?' for _ in columns)}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(file_id) DO UPDATE 
+        SET {', '.join(update_fields)}
+        RETURNING *'''
+
+@lru_cache(maxsize=128)
+def _update_sql(fields: tuple) -> str:
+    """Build the receipt UPDATE for a sorted tuple of field names"""
+    return f'''UPDATE receipt 
+        SET {', '.join(f"{key} = ?" for key in fields)}, updated_at = CURRENT_TIMESTAMP 
+        WHERE id = ?
+        RETURNING *'''
 
 class ReceiptRepository:
     
     @staticmethod
     def create(file_id: str, file_path: str, **kwargs) -> Dict[str, Any]:
-        """Create a new receipt record"""
+        """Create a new receipt record, or update the receipt already linked to the file"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if receipt already exists for this file
-        existing = cursor.execute(
-            'SELECT id FROM receipt WHERE file_id = ?', 
-            (file_id,)
-        ).fetchone()
-        
-        if existing:
-            # Update existing receipt
-            receipt_id = existing['id']
-            update_fields = []
-            update_values = []
-            
-            for key, value in kwargs.items():
-                if key in ['purchased_at', 'merchant_name', 'total_amount', 'tax_amount', 
-                          'subtotal', 'payment_method', 'raw_text']:
-                    update_fields.append(f"{key} = ?")
-                    update_values.append(value)
-            
-            if update_fields:
-                update_values.append(receipt_id)
-                cursor.execute(
-                    f'''UPDATE receipt 
-                        SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP 
-                        WHERE id = ?''',
-                    update_values
-                )
-                conn.commit()
-            
-            # Get updated record
-            result = cursor.execute(
-                'SELECT * FROM receipt WHERE id = ?', 
-                (receipt_id,)
-            ).fetchone()
-        else:
-            # Create new receipt
-            receipt_id = str(uuid.uuid4())
-            cursor.execute(
-                '''INSERT INTO receipt 
-                   (id, file_id, purchased_at, merchant_name, total_amount, file_path, created_at, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)''',
-                (receipt_id, file_id, kwargs.get('purchased_at'), 
-                 kwargs.get('merchant_name'), kwargs.get('total_amount'), file_path)
+        fields = tuple(sorted(key for key in kwargs if key in _CREATABLE))
+        values = [uuid7(), parse_uuid(file_id), file_path] + [kwargs[key] for key in fields]
+        
+        result = fetch_one(cursor.execute(_create_sql(fields), values))
+        conn.commit()
+        
+        return result
+    
+    @staticmethod
+    def save_extraction(file_id: str, file_path: str, **kwargs) -> Dict[str, Any]:
+        """Create or update the receipt of a file and mark the file processed in one transaction"""
+        conn = get_db_connection()
+        
+        fields = tuple(sorted(key for key in kwargs if key in _CREATABLE))
+        file_id = parse_uuid(file_id)
+        values = [uuid7(), file_id, file_path] + [kwargs[key] for key in fields]
+        
+        with conn:
+            result = fetch_one(conn.execute(_create_sql(fields), values))
+            conn.execute(
+                '''UPDATE receipt_file 
+                   SET is_processed = TRUE, updated_at = CURRENT_TIMESTAMP 
+                   WHERE id = ?''',
+                (file_id,)
             )
-            conn.commit()
-            
-            # Get created record
-            result = cursor.execute(
-                'SELECT * FROM receipt WHERE id = ?', 
-                (receipt_id,)
-            ).fetchone()
-        
-        conn.close()
-        return dict(result) if result else None
+        
+        return result
+    
+    @staticmethod
+    def create_many(rows: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Create or update receipts for many files in a single transaction
+        rows: dicts with file_id, file_path and any extracted receipt fields
+        Returns: {file_id: receipt_id} keyed by uuid.UUID
+        """
+        conn = get_db_connection()
+        receipt_ids = {}
+        
+        with conn:
+            for chunk in chunked(rows, BULK_CHUNK_SIZE):
+                conn.executemany(_CREATE_MANY_SQL, [
+                    [uuid7(), parse_uuid(row['file_id']), row['file_path']] + [row.get(key) for key in _RECEIPT_FIELDS]
+                    for row in chunk
+                ])
+                
+                # Existing receipts keep their id, so read the final ids back
+                file_ids = [parse_uuid(row['file_id']) for row in chunk]
+                results = conn.execute(
+                    f"SELECT id, file_id FROM receipt WHERE file_id IN ({', '.join('?' for _ in file_ids)})",
+                    file_ids
+                ).fetchall()
+                receipt_ids.update((file_id, receipt_id) for receipt_id, file_id in results)
+        
+        return receipt_ids
     
     @staticmethod
     def get_by_id(receipt_id: str) -> Optional[Dict[str, Any]]:
         """Get receipt by ID"""
         conn = get_db_connection()
-        result = conn.execute(
+        return fetch_one(conn.execute(
             'SELECT * FROM receipt WHERE id = ?', 
-            (receipt_id,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+            (parse_uuid(receipt_id),)
+        ))
     
     @staticmethod
     def get_by_file_id(file_id: str) -> Optional[Dict[str, Any]]:
         """Get receipt by file ID"""
         conn = get_db_connection()
-        result = conn.execute(
+        return fetch_one(conn.execute(
             'SELECT * FROM receipt WHERE file_id = ?', 
-            (file_id,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+            (parse_uuid(file_id),)
+        ))
     
     @staticmethod
     def get_all() -> List[Dict[str, Any]]:
         """Get all receipts"""
         conn = get_db_connection()
-        results = conn.execute('SELECT * FROM receipt ORDER BY created_at DESC').fetchall()
-        conn.close()
-        return [dict(row) for row in results]
+        return fetch_all(conn.execute('SELECT * FROM receipt ORDER BY created_at DESC'))
+    
+    @staticmethod
+    def count_by_merchant() -> Dict[str, int]:
+        """Count receipts per merchant name ('Unknown' when no merchant was extracted)"""
+        conn = get_db_connection()
+        return dict(conn.execute(
+            "SELECT COALESCE(merchant_name, 'Unknown'), COUNT(*) FROM receipt GROUP BY 1"
+        ).fetchall())
+    
+    @staticmethod
+    def get_page(cursor: str = None, limit: int = 100) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get a page of receipts, newest first, using keyset pagination
+        Returns: (receipts, next_cursor) where next_cursor is None on the last page
+        Raises ValueError for a malformed cursor
+        """
+        conn = get_db_connection()
+        
+        # Fetch one extra row to know whether another page follows
+        if cursor:
+            created_at, receipt_id = decode_cursor(cursor)
+            receipt_id = parse_uuid(receipt_id)
+            # A forged cursor must not reach the query with values SQLite cannot bind
+            if not isinstance(created_at, str) or receipt_id is None:
+                raise ValueError("Invalid cursor")
+            results = fetch_all(conn.execute(
+                f'''SELECT {_LIST_COLUMNS} FROM receipt 
+                    WHERE (created_at, id) < (?, ?) 
+                    ORDER BY created_at DESC, id DESC LIMIT ?''',
+                (created_at, receipt_id, limit + 1)
+            ))
+        else:
+            results = fetch_all(conn.execute(
+                f'SELECT {_LIST_COLUMNS} FROM receipt ORDER BY created_at DESC, id DESC LIMIT ?',
+                (limit + 1,)
+            ))
+        
+        receipts = results[:limit]
+        next_cursor = None
+        if len(results) > limit:
+            last = receipts[-1]
+            next_cursor = encode_cursor(last['created_at'], str(last['id']))
+        
+        return receipts, next_cursor
     
     @staticmethod
     def update(receipt_id: str, **kwargs) -> Optional[Dict[str, Any]]:
@@ -102,32 +183,17 @@ class ReceiptRepository:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        update_fields = []
-        update_values = []
-        
-        for key, value in kwargs.items():
-            if key in ['purchased_at', 'merchant_name', 'total_amount', 'tax_amount', 
-                      'subtotal', 'payment_method', 'raw_text', 'file_path']:
-                update_fields.append(f"{key} = ?")
-                update_values.append(value)
-        
-        if update_fields:
-            update_values.append(receipt_id)
-            cursor.execute(
-                f'''UPDATE receipt 
-                    SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP 
-                    WHERE id = ?''',
-                update_values
-            )
-            conn.commit()
+        fields = tuple(sorted(key for key in kwargs if key in _UPDATABLE))
         
-        # Get updated record
-        result = cursor.execute(
-            'SELECT * FROM receipt WHERE id = ?', 
-            (receipt_id,)
-        ).fetchone()
-        conn.close()
-        return dict(result) if result else None
+        if not fields:
+            return ReceiptRepository.get_by_id(receipt_id)
+        
+        result = fetch_one(cursor.execute(
+            _update_sql(fields), [kwargs[key] for key in fields] + [parse_uuid(receipt_id)]
+        ))
+        conn.commit()
+        
+        return result
     
     @staticmethod
     def delete(receipt_id: str) -> bool:
@@ -135,20 +201,22 @@ class ReceiptRepository:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('DELETE FROM receipt WHERE id = ?', (receipt_id,))
+        cursor.execute('DELETE FROM receipt WHERE id = ?', (parse_uuid(receipt_id),))
         deleted_count = cursor.rowcount
         conn.commit()
-        conn.close()
         
         return deleted_count > 0
     
     @staticmethod
-    def get_by_merchant(merchant_name: str) -> List[Dict[str, Any]]:
-        """Get receipts by merchant name"""
+    def get_by_merchant(merchant_name: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get receipts whose merchant name contains the given words (word prefix match)"""
         conn = get_db_connection()
-        results = conn.execute(
-            'SELECT * FROM receipt WHERE merchant_name LIKE ? ORDER BY created_at DESC',
-            (f'%{merchant_name}%',)
-        ).fetchall()
-        conn.close()
-        return [dict(row) for row in results]
+        
+        # Quote the input as a single FTS5 phrase so user text is never parsed as query syntax
+        phrase = '"{}"*'.format(merchant_name.replace('"', '""'))
+        return fetch_all(conn.execute(
+            '''SELECT r.* FROM receipt_fts f JOIN receipt r ON r.rowid = f.rowid 
+               WHERE receipt_fts MATCH ? 
+               ORDER BY r.created_at DESC LIMIT ?''',
+            (f'merchant_name : {phrase}', limit)
+        ))
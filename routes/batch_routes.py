@@ -2,6 +2,7 @@ from flask import Blueprint
 from controllers.batch_controller import BatchController
 
 batch_bp = Blueprint('batch', __name__)
+# Built once at import and shared by every request thread, so it keeps no per-request state
 batch_controller = BatchController()
 
 @batch_bp.route('/batch/discover', methods=['GET'])
@@ -19,6 +20,11 @@ def get_stats():
     """Get processing statistics"""
     return batch_controller.get_stats()
 
+@batch_bp.route('/batch/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and results of a batch job"""
+    return batch_controller.get_job(job_id)
+
 @batch_bp.route('/batch/upload', methods=['POST'])
 def batch_upload():
     """Upload multiple PDF files for processing"""
@@ -2,6 +2,7 @@ from flask import Blueprint, request
 from controllers.receipt_controller import ReceiptController
 
 receipt_bp = Blueprint('receipts', __name__)
+# Built once at import and shared by every request thread, so it keeps no per-request state
 receipt_controller = ReceiptController()
 
 @receipt_bp.route('/receipts', methods=['GET'])
@@ -2,6 +2,7 @@ from flask import Blueprint
 from controllers.upload_controller import UploadController
 
 upload_bp = Blueprint('upload', __name__)
+# Built once at import and shared by every request thread, so it keeps no per-request state
 upload_controller = UploadController()
 
 @upload_bp.route('/upload', methods=['POST'])
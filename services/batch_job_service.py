@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from repositories.batch_job_repository import BatchJobRepository
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BatchJobService:
+    """
+    Run batch processing in the background so requests return immediately
+    Jobs run one at a time per app process, their status is kept in the batch_job table
+    """
+    
+    def __init__(self, app, max_workers: int = 1):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-job')
+    
+    def submit(self, kind: str, func: Callable[..., Any], *args) -> Dict[str, Any]:
+        """
+        Queue func(*args), its return value becomes the job result
+        Returns: the queued job record
+        """
+        job = BatchJobRepository.create(kind)
+        self._executor.submit(self._run, job['id'], func, args)
+        return job
+    
+    def _run(self, job_id, func: Callable[..., Any], args: tuple):
+        """Run one job inside its own app context"""
+        with self.app.app_context():
+            BatchJobRepository.update_status(job_id, 'running')
+            try:
+                result = func(*args)
+                BatchJobRepository.update_status(job_id, 'completed', result)
+            except Exception as e:
+                logger.error(f"Batch job {job_id} failed: {str(e)}")
+                BatchJobRepository.update_status(job_id, 'failed', error=str(e))
+                return
+            logger.info(f"Batch job {job_id} completed")
+    
+    @staticmethod
+    def fail_interrupted_jobs() -> int:
+        """
+        Mark jobs left queued or running by a stopped server as failed
+        Only call this while no app process can be running jobs (server startup)
+        Returns: number of jobs marked failed
+        """
+        count = BatchJobRepository.fail_unfinished('Interrupted by a server restart')
+        if count:
+            logger.warning(f"Marked {count} interrupted batch jobs as failed")
+        return count
@@ -1,54 +1,133 @@
 import os
-import glob
-from typing import List, Dict, Any
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator
 from services.file_processing_service import FileProcessingService
 from repositories.receipt_file_repository import ReceiptFileRepository
 from repositories.receipt_repository import ReceiptRepository
+from config.database import bulk_write_mode
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Extracted receipts are written in groups of this size while later files are still extracting
+PERSIST_BATCH_SIZE = 100
+
+# Threads for the local PDF validation stage of the threaded pipeline
+VALIDATION_THREADS = 2
+
+# Most uploaded files written to disk at once
+UPLOAD_SAVE_THREADS = 16
+
+# File service owned by each batch pool worker process
+_worker_file_service = None
+
+def _init_worker(upload_folder: str, tesseract_cmd: str = None):
+    """Pool initializer: one single threaded Tesseract per worker, no OpenMP oversubscription"""
+    global _worker_file_service
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    _worker_file_service = FileProcessingService(upload_folder, tesseract_cmd)
+
+def _process_one_pdf(file_path: str, recorded_validation: tuple = None) -> tuple:
+    """Validate and extract one PDF inside a pool worker"""
+    return _validate_and_extract(_worker_file_service, file_path, recorded_validation)
+
+def _validate_pdf(file_service: FileProcessingService, file_path: str, recorded_validation: tuple = None) -> tuple:
+    """
+    Validate a PDF without touching the database, unless a result recorded for the unchanged file is given
+    Returns: (is_valid, validation_message)
+    """
+    if recorded_validation is not None:
+        return recorded_validation
+    
+    try:
+        return file_service.validate_file(file_path)
+    except Exception as e:
+        logger.error(f"Validation error for {file_path}: {str(e)}")
+        return False, str(e)
+
+def _extract_pdf(file_service: FileProcessingService, file_path: str, validation_message: str = None) -> tuple:
+    """
+    Extract a validated PDF without touching the database
+    Returns: (is_valid, validation_message, success, receipt_data, error_message)
+    """
+    try:
+        success, receipt_data, error = file_service.extract_receipt_data(file_path)
+        return True, validation_message, success, receipt_data, error
+    except Exception as e:
+        logger.error(f"Processing error for {file_path}: {str(e)}")
+        return True, validation_message, False, None, str(e)
+
+def _validate_and_extract(file_service: FileProcessingService, file_path: str,
+                          recorded_validation: tuple = None) -> tuple:
+    """
+    Validate and extract a PDF without touching the database
+    Returns: (is_valid, validation_message, success, receipt_data, error_message)
+    """
+    is_valid, validation_message = _validate_pdf(file_service, file_path, recorded_validation)
+    if not is_valid:
+        return False, validation_message, False, None, None
+    
+    return _extract_pdf(file_service, file_path, validation_message)
+
+def _drain(items: queue.Queue) -> None:
+    """Discard everything currently in a queue without blocking"""
+    try:
+        while True:
+            items.get_nowait()
+    except queue.Empty:
+        pass
+
 class BatchProcessingService:
     """Service to process existing PDF files in directory structure"""
     
-    def __init__(self, base_directory: str):
+    def __init__(self, base_directory: str, file_service: FileProcessingService = None, 
+                 unsafe_writes: bool = False, max_workers: int = None, tesseract_cmd: str = None,
+                 executor: str = 'thread'):
         self.base_directory = base_directory
-        self.file_service = FileProcessingService("uploads/receipts")
+        self.unsafe_writes = unsafe_writes
+        self.file_service = file_service or FileProcessingService("uploads/receipts", tesseract_cmd)
+        # Workers for PDF extraction, 1 extracts in-process with self.file_service
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.tesseract_cmd = tesseract_cmd
+        # 'thread' shares self.file_service (LLM clients, request batching) across the pipeline,
+        # 'process' (opt-in) gives every worker its own FileProcessingService
+        self.executor = executor
+    
+    def iter_pdf_files(self) -> Iterator[Dict[str, str]]:
+        """
+        Lazily walk the year directories (2018/, 2019/, etc.) for PDF files
+        Yields dictionaries with file info
+        """
+        # (directory path, path relative to base, year, category), carried down so no path re-parsing is needed
+        with os.scandir(self.base_directory) as entries:
+            stack = [(entry.path, entry.name, entry.name, None) for entry in entries
+                     if len(entry.name) == 4 and entry.name.isdigit() and entry.is_dir(follow_symlinks=False)]
+        
+        while stack:
+            path, relative_dir, year, category = stack.pop()
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    # DirEntry types come from the directory listing, no stat call per entry, and
+                    # relative paths are only joined for directories and PDFs
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, os.path.join(relative_dir, entry.name), year, category or entry.name))
+                    elif entry.name.lower().endswith('.pdf'):
+                        yield {
+                            'file_path': entry.path,
+                            'filename': entry.name,
+                            'year': year,
+                            'category': category or "uncategorized",
+                            'relative_path': os.path.join(relative_dir, entry.name)
+                        }
     
     def discover_pdf_files(self) -> List[Dict[str, str]]:
         """
         Discover all PDF files in the directory structure
         Returns list of dictionaries with file info
         """
-        pdf_files = []
-        
-        # Search for PDF files in year directories (2018/, 2019/, etc.)
-        year_pattern = os.path.join(self.base_directory, "[0-9][0-9][0-9][0-9]")
-        year_dirs = glob.glob(year_pattern)
-        
-        for year_dir in year_dirs:
-            # Search recursively in each year directory
-            pdf_pattern = os.path.join(year_dir, "**", "*.pdf")
-            pdf_files_in_year = glob.glob(pdf_pattern, recursive=True)
-            
-            for pdf_file in pdf_files_in_year:
-                # Extract year and category from path
-                relative_path = os.path.relpath(pdf_file, self.base_directory)
-                path_parts = relative_path.split(os.sep)
-                
-                year = path_parts[0] if len(path_parts) > 0 else "unknown"
-                category = path_parts[1] if len(path_parts) > 2 else "uncategorized"
-                filename = os.path.basename(pdf_file)
-                
-                pdf_files.append({
-                    'file_path': pdf_file,
-                    'filename': filename,
-                    'year': year,
-                    'category': category,
-                    'relative_path': relative_path
-                })
-        
-        return pdf_files
+        return list(self.iter_pdf_files())
     
     def process_all_pdfs(self) -> Dict[str, Any]:
         """
@@ -67,128 +146,313 @@ class BatchProcessingService:
         
         logger.info(f"Found {len(pdf_files)} PDF files to process")
         
+        # File records are keyed by name, a copy under another folder is extracted once
+        unique_files = {}
         for pdf_info in pdf_files:
+            first = unique_files.setdefault(pdf_info['filename'], pdf_info)
+            if first is not pdf_info:
+                results['details'].append({
+                    'filename': pdf_info['filename'],
+                    'status': 'skipped',
+                    'reason': f"Duplicate file name of {first['relative_path']}"
+                })
+        
+        existing_files = ReceiptFileRepository.get_by_file_names(unique_files)
+        
+        # Register only files seen for the first time, in a single transaction, known records are left untouched
+        new_files = [pdf_info for filename, pdf_info in unique_files.items() if filename not in existing_files]
+        if new_files:
+            with bulk_write_mode(self.unsafe_writes):
+                ReceiptFileRepository.create_many(
+                    (pdf_info['filename'], pdf_info['file_path']) for pdf_info in new_files
+                )
+            existing_files.update(ReceiptFileRepository.get_by_file_names(
+                pdf_info['filename'] for pdf_info in new_files
+            ))
+        
+        # Files still to extract, the database lookups stay in this process
+        pending_files = []
+        
+        for pdf_info in unique_files.values():
             try:
-                result = self._process_single_pdf(pdf_info)
-                results['details'].append(result)
-                
-                if result['status'] == 'processed':
-                    results['processed'] += 1
-                elif result['status'] == 'failed':
-                    results['failed'] += 1
-                elif result['status'] == 'skipped':
-                    results['skipped'] += 1
+                result, pending_file = self._prepare_single_pdf(pdf_info, existing_files[pdf_info['filename']])
+                if result is not None:
+                    results['details'].append(result)
+                else:
+                    pending_files.append(pending_file)
                     
             except Exception as e:
                 logger.error(f"Error processing {pdf_info['filename']}: {str(e)}")
-                results['failed'] += 1
                 results['details'].append({
                     'filename': pdf_info['filename'],
                     'status': 'failed',
                     'error': str(e)
                 })
         
+        results['details'].extend(self._extract_and_save(pending_files))
+        
+        return self._tally(results)
+    
+    def _extract_and_save(self, pending_files: List[tuple]) -> List[Dict[str, Any]]:
+        """
+        Extract (pdf_info, file_id, signature, recorded_validation) entries in parallel,
+        saving receipts and validation results in bulk as they complete
+        Returns: per-file results
+        """
+        details = []
+        pending_receipts = []
+        pending_validations = []
+        
+        files = [(pdf_info['file_path'], recorded_validation) for pdf_info, _, _, recorded_validation in pending_files]
+        for index, extraction in self._iter_extractions(files):
+            result, receipt_row, validation_row = self._build_result(pending_files[index], extraction)
+            details.append(result)
+            
+            if receipt_row is not None:
+                pending_receipts.append((result, receipt_row))
+            if validation_row is not None:
+                pending_validations.append(validation_row)
+            
+            # This thread is the only writer, so saving never contends with the extraction workers
+            if len(pending_receipts) + len(pending_validations) >= PERSIST_BATCH_SIZE:
+                self._save_receipts(pending_receipts)
+                self._save_validations(pending_validations)
+                pending_receipts = []
+                pending_validations = []
+        
+        self._save_receipts(pending_receipts)
+        self._save_validations(pending_validations)
+        return details
+    
+    def _tally(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Count the per-file statuses into the summary"""
+        for result in results['details']:
+            if result['status'] == 'processed':
+                results['processed'] += 1
+            elif result['status'] == 'failed':
+                results['failed'] += 1
+            elif result['status'] == 'skipped':
+                results['skipped'] += 1
+        
         return results
     
-    def _process_single_pdf(self, pdf_info: Dict[str, str]) -> Dict[str, Any]:
-        """Process a single PDF file"""
-        filename = pdf_info['filename']
-        file_path = pdf_info['file_path']
+    def _iter_extractions(self, files: List[tuple]) -> Iterator[tuple]:
+        """
+        Validate and extract (file_path, recorded_validation) pairs across a thread pipeline or process pool
+        Yields: (index into files, extraction) as extractions complete
+        """
+        workers = min(self.max_workers, len(files))
+        if workers <= 1:
+            for index, (file_path, recorded_validation) in enumerate(files):
+                yield index, _validate_and_extract(self.file_service, file_path, recorded_validation)
+            return
         
-        # Check if file already exists in database
-        existing_file = ReceiptFileRepository.get_by_file_name(filename)
+        if self.executor == 'thread':
+            logger.info(f"Extracting {len(files)} PDF files with {workers} threads")
+            yield from self._pipeline_extractions(files, workers)
+            return
+        
+        file_paths, recorded_validations = zip(*files)
+        logger.info(f"Extracting {len(files)} PDF files with {workers} worker processes")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.file_service.upload_folder, self.tesseract_cmd)
+        ) as executor:
+            yield from enumerate(executor.map(_process_one_pdf, file_paths, recorded_validations, chunksize=4))
+    
+    def _pipeline_extractions(self, files: List[tuple], workers: int) -> Iterator[tuple]:
+        """
+        Run validation and LLM extraction as thread stages connected by queues
+        (validation -> bounded extraction queue -> extraction -> caller), None stops a worker
+        Yields: (index into files, extraction) in completion order
+        """
+        validate_queue = queue.Queue()
+        extract_queue = queue.Queue(maxsize=workers * 2)
+        done_queue = queue.Queue()
+        # Set when the caller stops iterating, the stages then drop the files left
+        stop = threading.Event()
+        
+        def validate():
+            while True:
+                item = validate_queue.get()
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue
+                index, (file_path, recorded_validation) = item
+                is_valid, validation_message = _validate_pdf(self.file_service, file_path, recorded_validation)
+                if is_valid:
+                    extract_queue.put((index, file_path, validation_message))
+                else:
+                    done_queue.put((index, (False, validation_message, False, None, None)))
+        
+        def extract():
+            while True:
+                item = extract_queue.get()
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue
+                index, file_path, validation_message = item
+                done_queue.put((index, _extract_pdf(self.file_service, file_path, validation_message)))
         
-        if existing_file and existing_file['is_processed']:
+        for item in enumerate(files):
+            validate_queue.put(item)
+        validators = [threading.Thread(target=validate, name='pdf-validate', daemon=True)
+                      for _ in range(VALIDATION_THREADS)]
+        extractors = [threading.Thread(target=extract, name='pdf-extract', daemon=True) for _ in range(workers)]
+        for _ in validators:
+            validate_queue.put(None)
+        for thread in validators + extractors:
+            thread.start()
+        
+        try:
+            for _ in files:
+                yield done_queue.get()
+        finally:
+            stop.set()
+            # Validators skip what is left and reach their None, one may be blocked on the full
+            # extraction queue, so keep emptying it until they have all exited
+            for thread in validators:
+                while thread.is_alive():
+                    _drain(extract_queue)
+                    thread.join(timeout=0.05)
+            for thread in extractors:
+                extract_queue.put(None)
+            for thread in extractors:
+                thread.join()
+            # Results of files extracted after the caller stopped
+            _drain(done_queue)
+    
+    def _save_receipts(self, pending_receipts: List[tuple]) -> None:
+        """Save extracted receipts and mark their files processed in bulk"""
+        if not pending_receipts:
+            return
+        
+        try:
+            with bulk_write_mode(self.unsafe_writes):
+                receipt_ids = ReceiptRepository.create_many(row for _, row in pending_receipts)
+                ReceiptFileRepository.mark_processed_many(row['file_id'] for _, row in pending_receipts)
+            
+            for result, row in pending_receipts:
+                result['receipt_id'] = receipt_ids.get(row['file_id'])
+                
+        except Exception as e:
+            logger.error(f"Failed to save extracted receipts: {str(e)}")
+            for result, _ in pending_receipts:
+                result['status'] = 'failed'
+                result['error'] = str(e)
+    
+    def _save_validations(self, pending_validations: List[tuple]) -> None:
+        """Record the validation of files that were not extracted in bulk"""
+        if not pending_validations:
+            return
+        
+        try:
+            with bulk_write_mode(self.unsafe_writes):
+                ReceiptFileRepository.update_validation_many(pending_validations)
+        except Exception as e:
+            # Only the validation cache is lost, the files are validated again on the next run
+            logger.error(f"Failed to save validation results: {str(e)}")
+    
+    def _prepare_single_pdf(self, pdf_info: Dict[str, str], existing_file: Dict[str, Any]) -> tuple:
+        """
+        Check the file record of a single PDF, registered and fetched in bulk by the caller
+        Returns: (result, pending_file) where result is None if the file still needs extraction
+        and pending_file is (pdf_info, file_id, signature, recorded_validation)
+        """
+        filename = pdf_info['filename']
+        
+        if existing_file['is_processed']:
             return {
                 'filename': filename,
                 'status': 'skipped',
                 'reason': 'Already processed',
                 'file_id': existing_file['id']
-            }
+            }, None
         
-        try:
-            # Create or update file record
-            if existing_file:
-                file_id = existing_file['id']
-                # Update file path if different
-                if existing_file['file_path'] != file_path:
-                    ReceiptFileRepository.update_validation(file_id, False, None)
-            else:
-                # Create new file record
-                file_record = ReceiptFileRepository.create(filename, file_path)
-                file_id = file_record['id']
-            
-            # Validate PDF
-            is_valid, validation_message = self.file_service.validate_file(file_id)
-            
-            if not is_valid:
-                return {
-                    'filename': filename,
-                    'status': 'failed',
-                    'error': f'Invalid PDF: {validation_message}',
-                    'file_id': file_id
-                }
-            
-            # Process with LLM extraction
-            success, receipt_data, error = self.file_service.process_file(file_id)
-            
-            if success:
-                return {
-                    'filename': filename,
-                    'status': 'processed',
-                    'file_id': file_id,
-                    'receipt_id': receipt_data['id'] if receipt_data else None,
-                    'merchant_name': receipt_data.get('merchant_name') if receipt_data else None,
-                    'total_amount': receipt_data.get('total_amount') if receipt_data else None,
-                    'year': pdf_info['year'],
-                    'category': pdf_info['category']
-                }
-            else:
-                return {
-                    'filename': filename,
-                    'status': 'failed',
-                    'error': error,
-                    'file_id': file_id
-                }
-                
-        except Exception as e:
-            logger.error(f"Processing error for {filename}: {str(e)}")
+        # A validation recorded at the file's current mtime and size needs no PDF parse
+        signature = self.file_service.file_signature(pdf_info['file_path'])
+        
+        recorded_validation = self.file_service.recorded_validation(existing_file, pdf_info['file_path'], signature)
+        if recorded_validation is not None and not recorded_validation[0]:
             return {
                 'filename': filename,
                 'status': 'failed',
-                'error': str(e)
-            }
+                'error': f'Invalid PDF: {recorded_validation[1]}',
+                'file_id': existing_file['id']
+            }, None
+        return None, (pdf_info, existing_file['id'], signature, recorded_validation)
     
-    def get_processing_stats(self) -> Dict[str, Any]:
-        """Get statistics about processed files"""
+    def _build_result(self, pending_file: tuple, extraction: tuple) -> tuple:
+        """
+        Turn a worker extraction into a result
+        Returns: (result, receipt_row, validation_row) where receipt_row is None unless extraction succeeded
+        and validation_row is the (file_id, is_valid, invalid_reason, signature) to record for files not extracted
+        """
+        pdf_info, file_id, signature, recorded_validation = pending_file
+        filename = pdf_info['filename']
+        is_valid, validation_message, success, receipt_data, error = extraction
         
-        # Get all files from database
-        all_files = ReceiptFileRepository.get_all()
-        all_receipts = ReceiptRepository.get_all()
+        if not is_valid:
+            return {
+                'filename': filename,
+                'status': 'failed',
+                'error': f'Invalid PDF: {validation_message}',
+                'file_id': file_id
+            }, None, (file_id, False, validation_message, signature)
         
-        stats = {
-            'total_files_in_db': len(all_files),
-            'valid_files': len([f for f in all_files if f['is_valid']]),
-            'processed_files': len([f for f in all_files if f['is_processed']]),
-            'total_receipts': len(all_receipts),
-            'files_by_year': {},
-            'receipts_by_merchant': {}
-        }
+        if success:
+            return {
+                'filename': filename,
+                'status': 'processed',
+                'file_id': file_id,
+                'receipt_id': None,
+                'merchant_name': receipt_data.get('merchant_name'),
+                'total_amount': receipt_data.get('total_amount'),
+                # Only discovered files carry folder information
+                **{key: pdf_info[key] for key in ('year', 'category') if key in pdf_info}
+            }, dict(receipt_data, file_id=file_id, file_path=pdf_info['file_path']), None
         
-        # Count receipts by merchant
-        for receipt in all_receipts:
-            merchant = receipt.get('merchant_name', 'Unknown')
-            stats['receipts_by_merchant'][merchant] = stats['receipts_by_merchant'].get(merchant, 0) + 1
+        # Keep the validation so a retry only repeats the extraction
+        validation_row = (file_id, True, None, signature) if recorded_validation is None else None
         
-        return stats
+        return {
+            'filename': filename,
+            'status': 'failed',
+            'error': error,
+            'file_id': file_id
+        }, None, validation_row
+    
+    def get_processing_stats(self) -> Dict[str, Any]:
+        """Get statistics about processed files, aggregated in SQL"""
+        file_counts = ReceiptFileRepository.count_stats()
+        receipts_by_merchant = ReceiptRepository.count_by_merchant()
+        
+        return {
+            'total_files_in_db': file_counts['total'],
+            'valid_files': file_counts['valid'],
+            'processed_files': file_counts['processed'],
+            'total_receipts': sum(receipts_by_merchant.values()),
+            'files_by_year': {},
+            'receipts_by_merchant': receipts_by_merchant
+        }
     
     def process_uploaded_files(self, files) -> Dict[str, Any]:
         """
         Process multiple uploaded PDF files
         Returns summary of processing results
         """
+        results, pending_files = self.save_uploaded_files(files)
+        return self.extract_saved_files(results, pending_files)
+    
+    def save_uploaded_files(self, files) -> tuple:
+        """
+        Save uploaded PDF files to disk, this has to happen while the request is open
+        Returns: (results, pending_files) for extract_saved_files
+        """
         from werkzeug.utils import secure_filename
-        import os
         
         results = {
             'total_files': len(files),
@@ -200,6 +464,15 @@ class BatchProcessingService:
         
         logger.info(f"Processing {len(files)} uploaded files")
         
+        # {filename: (file, file_path)} of uploads to write, the database is only touched on this thread
+        to_save = {}
+        # {filename: content_hash} and {content_hash: filename} of those uploads
+        content_hashes = {}
+        hashed_names = {}
+        existing_files = ReceiptFileRepository.get_by_file_names(
+            secure_filename(file.filename) for file in files if file.filename
+        )
+        
         for file in files:
             try:
                 # Skip empty files
@@ -207,12 +480,9 @@ class BatchProcessingService:
                     continue
                 
                 filename = secure_filename(file.filename)
-                
-                # Check if file already exists in database
-                existing_file = ReceiptFileRepository.get_by_file_name(filename)
+                existing_file = existing_files.get(filename)
                 
                 if existing_file and existing_file['is_processed']:
-                    results['skipped'] += 1
                     results['details'].append({
                         'filename': filename,
                         'status': 'skipped',
@@ -221,61 +491,99 @@ class BatchProcessingService:
                     })
                     continue
                 
-                # Save uploaded file
-                upload_result = self.file_service.save_uploaded_file(file)
-                if not upload_result['success']:
-                    results['failed'] += 1
+                # Both copies would be written to the same path, keep the first
+                if filename in to_save:
                     results['details'].append({
                         'filename': filename,
-                        'status': 'failed',
-                        'error': upload_result['error']
+                        'status': 'skipped',
+                        'reason': 'Duplicate file name in upload'
                     })
                     continue
                 
-                file_id = upload_result['file_id']
-                
-                # Validate PDF
-                is_valid, validation_message = self.file_service.validate_file(file_id)
-                
-                if not is_valid:
-                    results['failed'] += 1
+                # The same content under another name is extracted once
+                content_hash = self.file_service.hash_upload(file)
+                if content_hash in hashed_names:
                     results['details'].append({
                         'filename': filename,
-                        'status': 'failed',
-                        'error': f'Invalid PDF: {validation_message}',
-                        'file_id': file_id
+                        'status': 'skipped',
+                        'reason': f'Same content as {hashed_names[content_hash]} in upload'
                     })
                     continue
                 
-                # Process with LLM extraction
-                success, receipt_data, error = self.file_service.process_file(file_id)
-                
-                if success:
-                    results['processed'] += 1
-                    results['details'].append({
-                        'filename': filename,
-                        'status': 'processed',
-                        'file_id': file_id,
-                        'receipt_id': receipt_data['id'] if receipt_data else None,
-                        'merchant_name': receipt_data.get('merchant_name') if receipt_data else None,
-                        'total_amount': receipt_data.get('total_amount') if receipt_data else None
-                    })
-                else:
-                    results['failed'] += 1
-                    results['details'].append({
-                        'filename': filename,
-                        'status': 'failed',
-                        'error': error,
-                        'file_id': file_id
-                    })
+                to_save[filename] = (file, self.file_service.upload_path(filename, existing_file))
+                content_hashes[filename] = content_hash
+                hashed_names[content_hash] = filename
                     
             except Exception as e:
                 logger.error(f"Error processing uploaded file {file.filename}: {str(e)}")
-                results['failed'] += 1
                 results['details'].append({
                     'filename': file.filename,
                     'status': 'failed',
                     'error': str(e)
                 })
         
-        return results
+        # One lookup for content that was already extracted, those uploads are neither written nor extracted
+        processed_copies = ReceiptFileRepository.get_processed_by_content_hashes(content_hashes.values())
+        for filename, content_hash in content_hashes.items():
+            original = processed_copies.get(content_hash)
+            if original:
+                del to_save[filename]
+                results['details'].append({
+                    'filename': filename,
+                    'status': 'skipped',
+                    'reason': f"Same content as already processed {original['file_name']}",
+                    'file_id': original['id']
+                })
+        
+        saved = self._write_uploads(to_save, results)
+        
+        # Register the saved files in one transaction
+        ReceiptFileRepository.create_many(
+            (filename, file_path, content_hashes[filename]) for filename, file_path in saved.items()
+        )
+        records = ReceiptFileRepository.get_by_file_names(saved)
+        
+        pending_files = [
+            ({'filename': filename, 'file_path': file_path}, records[filename]['id'],
+             self.file_service.file_signature(file_path), None)
+            for filename, file_path in saved.items()
+        ]
+        return results, pending_files
+    
+    def _write_uploads(self, to_save: Dict[str, tuple], results: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Write uploads to disk concurrently, recording the failed ones in results
+        Returns: {filename: file_path} of the written files
+        """
+        if not to_save:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_SAVE_THREADS, len(to_save))) as executor:
+            futures = {
+                filename: executor.submit(self.file_service.write_upload, file, file_path)
+                for filename, (file, file_path) in to_save.items()
+            }
+        
+        saved = {}
+        for filename, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                logger.error(f"File save error for {filename}: {str(error)}")
+                results['details'].append({
+                    'filename': filename,
+                    'status': 'failed',
+                    'error': str(error)
+                })
+            else:
+                saved[filename] = to_save[filename][1]
+        
+        return saved
+    
+    def extract_saved_files(self, results: Dict[str, Any], pending_files: List[tuple]) -> Dict[str, Any]:
+        """
+        Extract files saved by save_uploaded_files
+        Returns summary of processing results
+        """
+        results['details'].extend(self._extract_and_save(pending_files))
+        
+        return self._tally(results)
@@ -0,0 +1,52 @@
+from marshmallow import Schema, fields, INCLUDE
+from typing import Any, Optional
+
+class ReceiptExtractionSchema(Schema):
+    """Receipt fields the extraction prompt asks the LLM for, all of them may be null"""
+    
+    class Meta:
+        # Extra keys in a reply are kept, the repositories ignore what they do not store
+        unknown = INCLUDE
+    
+    merchant_name = fields.String(allow_none=True)
+    total_amount = fields.Float(allow_none=True)
+    tax_amount = fields.Float(allow_none=True)
+    subtotal = fields.Float(allow_none=True)
+    purchased_at = fields.Date(allow_none=True)
+    payment_method = fields.String(allow_none=True)
+    items = fields.List(fields.Raw(), allow_none=True)
+
+receipt_extraction_schema = ReceiptExtractionSchema()
+
+def _nullable(json_type: str) -> dict:
+    return {"type": [json_type, "null"]}
+
+# The same fields as a strict JSON Schema, for providers that enforce structured output server side.
+# Strict mode needs every property listed as required, absent values are sent as null
+RECEIPT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "merchant_name": _nullable("string"),
+        "total_amount": _nullable("number"),
+        "tax_amount": _nullable("number"),
+        "subtotal": _nullable("number"),
+        "purchased_at": {"type": ["string", "null"], "description": "YYYY-MM-DD"},
+        "payment_method": _nullable("string"),
+        "items": {
+            "type": ["array", "null"],
+            "items": {
+                "type": "object",
+                "properties": {"name": _nullable("string"), "price": _nullable("number")},
+                "required": ["name", "price"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["merchant_name", "total_amount", "tax_amount", "subtotal", "purchased_at", "payment_method", "items"],
+    "additionalProperties": False,
+}
+
+def extraction_errors(result: Any) -> Optional[dict]:
+    """Schema errors of an extraction result (a receipt or a list of them), None if it is valid"""
+    errors = receipt_extraction_schema.validate(result, many=isinstance(result, list))
+    return errors or None
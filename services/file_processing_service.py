@@ -1,25 +1,33 @@
 import os
+import io
+import shutil
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 from werkzeug.utils import secure_filename
 from services.ocr_service import OCRService
-from services.pdf_validation_service import PDFValidationService
+from services.pdf_validation_service import PDFValidationService, VALID_PDF_MESSAGE
+from services.llm_batching_service import BatchingLLMClient
 from repositories.receipt_file_repository import ReceiptFileRepository
 from repositories.receipt_repository import ReceiptRepository
+from config.config import Config
 import logging
-import tempfile
-
-# Import for PDF to image conversion
-try:
-    from pdf2image import convert_from_path
-    PDF2IMAGE_AVAILABLE = True
-except ImportError:
-    PDF2IMAGE_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Suffixes accepted for uploads, e.g. ('.pdf',)
+ALLOWED_SUFFIXES = tuple(f'.{extension}' for extension in Config.ALLOWED_EXTENSIONS)
+
+# Chunk size for copying uploads that cannot be sent with os.sendfile
+UPLOAD_COPY_BUFFER = 1024 * 1024
+
+# Validation results kept per service, keyed by (path, mtime_ns, size)
+VALIDATION_CACHE_SIZE = 4096
+
 class FileProcessingService:
     def process_file(self, file_id: str) -> tuple:
         """
-        Process PDF file with LLM/AI extraction only (no OCR, no image conversion)
+        Process PDF file with LLM/AI extraction only (no OCR, PDFs without text are sent as a first page image)
         Returns: (success, receipt_data, error_message)
         """
         receipt_file = ReceiptFileRepository.get_by_id(file_id)
@@ -28,31 +36,40 @@ class FileProcessingService:
         if not receipt_file['is_valid']:
             return False, None, "File is not valid"
 
+        success, llm_data, error = self.extract_receipt_data(receipt_file['file_path'])
+        if not success:
+            return False, llm_data, error
+
+        # Create or update the file's receipt and mark the file processed
+        receipt = ReceiptRepository.save_extraction(
+            file_id=receipt_file['id'],
+            file_path=receipt_file['file_path'],
+            **llm_data
+        )
+        return True, receipt, None
+    
+    def extract_receipt_data(self, file_path: str) -> tuple:
+        """
+        Extract receipt data from a validated PDF file without saving it
+        Returns: (success, receipt_data, error_message)
+        """
         # Use only LLM/AI extraction from PDF file directly
         if hasattr(self.ocr_service, 'llm_service') and self.ocr_service.llm_service:
-            logger.info("Starting LLM extraction process (using PDF file directly, no OCR, no image conversion)...")
-            llm_data = self.ocr_service.llm_service.extract_receipt_data_from_pdf(receipt_file['file_path'])
-            logger.info(f"LLM extraction result: {llm_data}")
+            logger.info("Starting LLM extraction process (PDF text, or the first page image if the PDF has no text)...")
+            extractor = self.llm_batcher or self.ocr_service.llm_service
+            llm_data = extractor.extract_receipt_data_from_pdf(file_path)
+            # Logged lazily, the result dict is only formatted when DEBUG records are emitted
+            logger.debug("LLM extraction result: %s", llm_data)
             # Check if LLM extraction was successful
             has_merchant = llm_data.get('merchant_name') is not None
             has_total = llm_data.get('total_amount') is not None
             has_date = llm_data.get('purchased_at') is not None
             extraction_success = has_merchant and (has_total or has_date)
-            logger.info(f"LLM Extraction success: {extraction_success} (merchant: {llm_data.get('merchant_name')}, total: {llm_data.get('total_amount')}, date: {llm_data.get('purchased_at')})")
+            logger.info(
+                "LLM Extraction success: %s (merchant: %s, total: %s, date: %s)", extraction_success,
+                llm_data.get('merchant_name'), llm_data.get('total_amount'), llm_data.get('purchased_at')
+            )
             if extraction_success:
-                # Mark file as processed and create receipt
-                existing_receipt = ReceiptRepository.get_by_file_id(file_id)
-                if existing_receipt:
-                    updated_receipt = ReceiptRepository.update(existing_receipt['id'], **llm_data)
-                    llm_data = updated_receipt
-                else:
-                    new_receipt = ReceiptRepository.create(
-                        file_id=file_id,
-                        file_path=receipt_file['file_path'],
-                        **llm_data
-                    )
-                    llm_data = new_receipt
-                ReceiptFileRepository.mark_processed(file_id)
                 return True, llm_data, None
             else:
                 return False, llm_data, f"LLM extraction failed. LLM output: {llm_data}"
@@ -60,31 +77,82 @@ class FileProcessingService:
             logger.error("No LLM service available for extraction.")
             return False, None, "No LLM service available for extraction."
     
-    def __init__(self, upload_folder: str, tesseract_cmd: str = None):
+    def __init__(self, upload_folder: str, tesseract_cmd: str = None, 
+                 llm_batch_size: int = 1, llm_batch_wait_ms: int = 50, llm_batch_concurrency: int = 4):
         self.upload_folder = upload_folder
         self.ocr_service = OCRService(tesseract_cmd)
         self.pdf_validator = PDFValidationService()
+        # A changed file gets a new mtime/size and therefore a new cache key
+        self._validate_cached = lru_cache(maxsize=VALIDATION_CACHE_SIZE)(self._validate_uncached)
+        
+        # Concurrent extractions share multi-document LLM requests when batching is enabled
+        self.llm_batcher = None
+        if llm_batch_size > 1 and self.ocr_service.llm_service:
+            self.llm_batcher = BatchingLLMClient(
+                self.ocr_service.llm_service, llm_batch_size, llm_batch_wait_ms, llm_batch_concurrency
+            )
         
-        # Ensure upload folder exists
-        os.makedirs(upload_folder, exist_ok=True)
+        # Uploads are stored in a receipts subdirectory, created once (with the upload folder) here
+        self.receipts_folder = os.path.join(upload_folder, 'receipts')
+        os.makedirs(self.receipts_folder, exist_ok=True)
+    
+    def close(self):
+        """Release the LLM service HTTP connections"""
+        if self.ocr_service.llm_service:
+            self.ocr_service.llm_service.close()
     
     def allowed_file(self, filename: str) -> bool:
         """Check if file extension is allowed"""
-        return '.' in filename and \
-               filename.rsplit('.', 1)[1].lower() == 'pdf'
+        return filename.lower().endswith(ALLOWED_SUFFIXES)
     
     def validate_file(self, file_path: str) -> tuple:
         """
-        Validate uploaded PDF file
+        Validate uploaded PDF file, reusing the result while the file is unchanged
         Returns: (is_valid, error_message)
         """
         try:
-            is_valid, error_message = self.pdf_validator.validate_pdf(file_path)
-            return is_valid, error_message
+            signature = self.file_signature(file_path)
+            if signature is None:
+                return self.pdf_validator.validate_pdf(file_path)
+            return self._validate_cached(file_path, *signature)
         except Exception as e:
             logger.error(f"File validation error: {str(e)}")
             return False, f"Validation failed: {str(e)}"
     
+    def _validate_uncached(self, file_path: str, mtime_ns: int, size: int) -> tuple:
+        """Parse the PDF, the stat values only key the cache"""
+        return self.pdf_validator.validate_pdf(file_path)
+    
+    @staticmethod
+    def file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+        """
+        Stat a file for validation caching
+        Returns: (mtime_ns, size), or None if the file cannot be stat'ed
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    @staticmethod
+    def recorded_validation(receipt_file: Optional[Dict[str, Any]], file_path: str,
+                            signature: Optional[Tuple[int, int]]) -> Optional[tuple]:
+        """
+        Validation stored on a file record, if it was recorded for this exact file
+        Returns: (is_valid, error_message), or None if the file must be validated again
+        """
+        if not receipt_file or signature is None or receipt_file['validated_mtime'] is None:
+            return None
+        if receipt_file['file_path'] != file_path:
+            return None
+        if (receipt_file['validated_mtime'], receipt_file['validated_size']) != signature:
+            return None
+        
+        if receipt_file['is_valid']:
+            return True, VALID_PDF_MESSAGE
+        return False, receipt_file['invalid_reason']
+    
     def save_uploaded_file(self, file, filename: str = None) -> tuple:
         """
         Save uploaded file and create database record
@@ -96,25 +164,71 @@ class FileProcessingService:
             # Secure the filename
             filename = secure_filename(filename)
             
-            # Ensure receipts subdirectory exists
-            receipts_folder = os.path.join(self.upload_folder, 'receipts')
-            os.makedirs(receipts_folder, exist_ok=True)
-            
             # Check for duplicate files
             existing_file = ReceiptFileRepository.get_by_file_name(filename)
+            file_path = self.upload_path(filename, existing_file)
+            self.write_upload(file, file_path)
             if existing_file:
-                # Update existing file
-                file_path = existing_file['file_path']
-                file.save(file_path)
                 return existing_file['id'], file_path, None
             
-            # Create new file with receipts subdirectory
-            file_path = os.path.join(receipts_folder, filename)
-            file.save(file_path)
-            
             # Create database record
             receipt_file = ReceiptFileRepository.create(filename, file_path)
             return receipt_file['id'], file_path, None
         except Exception as e:
             logger.error(f"File save error: {str(e)}")
             return None, None, str(e)
+    
+    def upload_path(self, filename: str, existing_file: Optional[Dict[str, Any]] = None) -> str:
+        """Where an upload is stored: over the existing file's copy, or in the receipts subdirectory"""
+        if existing_file:
+            return existing_file['file_path']
+        return os.path.join(self.receipts_folder, filename)
+    
+    def write_upload(self, file, file_path: str):
+        """Write an uploaded file to disk, no database access so it can run on any thread"""
+        with open(file_path, 'wb') as destination:
+            if not self._sendfile_upload(file.stream, destination):
+                shutil.copyfileobj(file.stream, destination, UPLOAD_COPY_BUFFER)
+    
+    @staticmethod
+    def hash_upload(file) -> str:
+        """blake2b-128 hex digest of an uploaded file, leaving its stream where it was"""
+        digest = hashlib.blake2b(digest_size=16)
+        stream = file.stream
+        start = stream.tell()
+        while chunk := stream.read(UPLOAD_COPY_BUFFER):
+            digest.update(chunk)
+        stream.seek(start)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _sendfile_upload(source, destination) -> bool:
+        """
+        Copy an upload spooled to disk inside the kernel
+        Returns: False, with both files untouched, when the upload has no OS file to send from
+        """
+        # Small uploads stay in memory, asking a SpooledTemporaryFile for fileno() would write them out first
+        if not hasattr(os, 'sendfile') or not getattr(source, '_rolled', True):
+            return False
+        try:
+            source_fd = source.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        
+        offset = source.tell()
+        remaining = os.fstat(source_fd).st_size - offset
+        try:
+            while remaining > 0:
+                sent = os.sendfile(destination.fileno(), source_fd, offset, remaining)
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+        except OSError:
+            # e.g. a filesystem without sendfile support, start over with a regular copy
+            destination.seek(0)
+            destination.truncate()
+            return False
+        
+        source.seek(offset)
+        return True
@@ -0,0 +1,79 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BatchingLLMClient:
+    """
+    Coalesce concurrent PDF extractions into multi-document LLM requests
+    A batch is sent once max_batch PDFs are queued or the oldest has waited max_wait_ms,
+    up to max_concurrent batches are in flight at once
+    """
+    
+    def __init__(self, llm_service, max_batch: int = 8, max_wait_ms: int = 50, max_concurrent: int = 4):
+        self.llm_service = llm_service
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        # A batch is only collected once a flush worker is free, so PDFs queued meanwhile fill the next one
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='llm-batch')
+        self._thread = threading.Thread(target=self._run, name='llm-batcher', daemon=True)
+        self._thread.start()
+    
+    def submit(self, pdf_path: str) -> Future:
+        """Queue a PDF for extraction, the future resolves to the extracted receipt dict"""
+        future = Future()
+        self._queue.put((pdf_path, future))
+        return future
+    
+    def extract_receipt_data_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
+        """Blocking drop-in for LLMExtractionService.extract_receipt_data_from_pdf"""
+        return self.submit(pdf_path).result()
+    
+    def _run(self):
+        """Collect queued PDFs into batches for the life of the process"""
+        while True:
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._executor.submit(self._flush, batch).add_done_callback(lambda _: self._slots.release())
+    
+    def _flush(self, batch: list):
+        """Extract one batch, resolving every future even if the request fails"""
+        try:
+            texts = [self.llm_service.extract_text_from_pdf(pdf_path) for pdf_path, _ in batch]
+            
+            # PDFs without text are kept out of the text request
+            pending = [(future, text) for (_, future), text in zip(batch, texts) if text]
+            
+            if pending:
+                logger.info("Extracting %d PDFs in one LLM request", len(pending))
+                results = self.llm_service.extract_receipt_data_from_texts([text for _, text in pending])
+                for (future, _), result in zip(pending, results):
+                    future.set_result(result or {})
+            
+            # and sent to the vision models as first page images after it
+            for (pdf_path, future), text in zip(batch, texts):
+                if not text:
+                    future.set_result(self.llm_service.extract_receipt_data_from_pdf_image(pdf_path) or {})
+        
+        except Exception as e:
+            logger.error(f"Batched LLM extraction failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,69 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import orjson
+from typing import Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+def cache_key(*parts) -> bytes:
+    """SHA-256 over length-prefixed str/bytes parts, so different part lists never share a key"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.digest()
+
+class LLMCache:
+    """
+    LLM extraction results keyed by request content, stored in their own SQLite file
+    so they outlive database resets. Cache errors are logged and treated as misses
+    """
+    
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, expired entries are purged when it is opened"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS llm_cache (key BLOB PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (time.time(),))
+            self._local.conn = conn
+        return conn
+    
+    def get(self, key: bytes) -> Optional[Any]:
+        """Cached value for key, None if missing or expired"""
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {str(e)}")
+            return None
+        return orjson.loads(row[0]) if row else None
+    
+    def set(self, key: bytes, value: Any, ttl_seconds: int = None):
+        """Store a JSON serializable value for ttl_seconds (default: the cache TTL)"""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    '''INSERT INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)
+                       ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at''',
+                    (key, orjson.dumps(value).decode(), time.time() + (ttl_seconds or self.ttl_seconds))
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {str(e)}")
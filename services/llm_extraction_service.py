@@ -1,37 +1,302 @@
-import openai
-import google.generativeai as genai
-import anthropic
-import json
+import asyncio
+import orjson
+import re
+import hashlib
+import io
 import logging
-from typing import Dict, Optional, Any
+import mmap
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Awaitable, Callable, Union
+from PIL import Image
 from config.config import Config
-import base64
+from services.llm_cache import LLMCache, cache_key
+from services.extraction_schema import RECEIPT_JSON_SCHEMA, extraction_errors
+import binascii
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+# Part of every LLM cache key, bump when prompts or result handling change
+PROMPT_VERSION = "v1"
+
+# Receipt extraction instructions, the document text is appended after "Document text:"
+EXTRACTION_PROMPT = """
+Act as a receipt data extraction expert. You MUST carefully analyze ANY transaction document (receipts, invoices, tickets, passes) and extract ALL available information with high accuracy.
+
+CRITICAL INSTRUCTIONS FOR MERCHANT NAME:
+1. Look for business/organization names at the TOP of the document
+2. Accept ANY type of merchant: restaurants ("APPLEBEE'S"), stores ("WALMART"), transit systems ("San Francisco Transit"), services, government agencies
+3. For transit passes/tickets: use city name + "Transit" or the transit authority name
+4. For government/public services: use the agency or location name
+5. NEVER return null for merchant_name - always find SOME identifying name/organization
+6. If no clear business name, use location or service provider name
+
+DOCUMENT TYPE RECOGNITION:
+- Restaurant receipts: Business name at top, food items, tax, total
+- Retail receipts: Store name, product items, tax, total  
+- Transit passes/tickets: Transit authority, pass type, zones, fare amount
+- Service receipts: Service provider, description, amount
+- Parking tickets: Location, duration, fee
+
+EXTRACTION RULES:
+- merchant_name: ANY business, organization, or service provider name (REQUIRED)
+- total_amount: Final amount paid (look for "Total", "Amount Due", fare, fee)
+- tax_amount: Tax if specified (may not apply to transit/government)
+- subtotal: Amount before tax if shown
+- purchased_at: Transaction date in YYYY-MM-DD format
+- payment_method: Payment type if mentioned
+- items: Services, products, or pass types with prices
+
+EXAMPLES:
+Restaurant: {"merchant_name": "APPLEBEE'S", "total_amount": 128.23, "purchased_at": "2018-12-01"}
+Transit: {"merchant_name": "San Francisco Transit", "total_amount": 7.50, "purchased_at": "2018-07-23", "items": [{"name": "DAY PASS ZONE 1", "price": 7.50}]}
+Retail: {"merchant_name": "WALMART", "total_amount": 45.67, "purchased_at": "2024-01-15"}
+
+Return ONLY a valid JSON object. Use null only if information is completely absent from the document.
+
+Document text:
+"""
+
+# Outermost JSON object or array of a reply, dropping markdown fences and stray text around it
+JSON_SPAN = re.compile(r'[\[{].*[\]}]', re.S)
+
+def parse_llm_json(result_text: str) -> Any:
+    """Parse the JSON value of an LLM reply (raises ValueError if there is none)"""
+    match = JSON_SPAN.search(result_text)
+    if not match:
+        raise ValueError(f"No JSON in LLM reply: {result_text[:100]}")
+    return orjson.loads(match.group())
+
+def parse_extraction(result_text: str) -> Any:
+    """Parse an LLM reply and check it against the receipt schema (raises ValueError with the reason)"""
+    result = parse_llm_json(result_text)
+    errors = extraction_errors(result)
+    if errors:
+        raise ValueError(f"Fields do not match the schema: {errors}")
+    return result
+
+# Characters of document text kept for the prompt: the start (merchant, items) and the end (totals)
+PROMPT_HEAD_CHARS = 6000
+PROMPT_TAIL_CHARS = 2000
+
+TRUNCATION_MARKER = "\n...[truncated]...\n"
+
+def squeeze_text(text: str, head: int = PROMPT_HEAD_CHARS, tail: int = PROMPT_TAIL_CHARS) -> str:
+    """
+    Cut the middle out of long document text, input tokens are billed and slow down the reply
+    Squeezed text is returned unchanged, so its cache key stays the same
+    """
+    if len(text) <= head + len(TRUNCATION_MARKER) + tail:
+        return text
+    return text[:head] + TRUNCATION_MARKER + text[-tail:]
+
+# Output token budget per receipt, itemized receipts fit well within it
+RECEIPT_MAX_TOKENS = 300
+
+# Times an unparsable or invalid reply is sent back to the same provider with the error
+FEEDBACK_RETRIES = 2
+
+def _chat_turn(role: str, content: str) -> Dict[str, str]:
+    """Conversation message for the OpenAI and Anthropic APIs"""
+    return {"role": role, "content": content}
+
+def _gemini_turn(role: str, content: str) -> Dict[str, Any]:
+    """Conversation message for the Gemini API"""
+    return {"role": role, "parts": [content]}
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """A text extraction provider, everything else (hedging, feedback retries, parsing) is shared"""
+    name: str
+    # (text, prompt, max_tokens) -> keyword arguments of call, the conversation under conversation_key
+    request: Callable[[str, str, int], Dict[str, Any]]
+    call: Callable[..., Awaitable[Any]]
+    # SDK response -> reply text
+    reply: Callable[[Any], str]
+    conversation_key: str
+    turn: Callable[[str, str], Dict[str, Any]]
+    reply_role: str
+    # Requests in flight to the provider
+    limit: asyncio.Semaphore
+
+# Vision requests send the same instructions next to the image
+OPENAI_VISION_PROMPT = "Extract receipt data from this image and return as JSON: " + EXTRACTION_PROMPT
+GEMINI_VISION_PROMPT = "Extract receipt data from this image: " + EXTRACTION_PROMPT
+
+@lru_cache(maxsize=32)
+def _multi_document_prompt(document_count: int) -> str:
+    """EXTRACTION_PROMPT asking for one object per '=== DOCUMENT n ===' section"""
+    return EXTRACTION_PROMPT.replace(
+        "Return ONLY a valid JSON object.",
+        f"The text below holds {document_count} documents, each starting with a "
+        f"'=== DOCUMENT n ===' line. Return ONLY a valid JSON array of {document_count} objects, "
+        f"one per document in the same order."
+    ).replace("Document text:", "Documents:")
+
+# pdf2image renders through pdftocairo when poppler ships it (faster than pdftoppm)
+PDFTOCAIRO_AVAILABLE = shutil.which('pdftocairo') is not None
+
+# JPEG quality of first page renders, enough for receipt text at PREVIEW_DPI
+PREVIEW_JPEG_QUALITY = 75
+
+# Images above this size are downscaled and re-encoded before they are sent to the vision APIs
+VISION_REENCODE_BYTES = 512 * 1024
+# Longest edge of downscaled images, enough for receipt text
+VISION_MAX_EDGE = 1600
+
+# OpenAI and Anthropic SDK clients retry connection errors, 408/409/429 and 5xx themselves with
+# exponential backoff that honors Retry-After; only errors left after that reach the next provider
+SDK_MAX_RETRIES = 3
+SDK_TIMEOUT = httpx.Timeout(20.0, connect=5.0, write=10.0, pool=5.0)
+
+# Pages are read until the text passes this many characters, receipts rarely have more
+RECEIPT_TEXT_CHARS = 4096
+
+# Host pools kept by the shared HTTP session, and keep-alive connections held per host.
+# Thread pool extraction runs one call per worker thread at a time, connections beyond
+# the per-host limit are closed after use instead of being reused
+HTTP_POOL_CONNECTIONS = 32
+HTTP_POOL_MAXSIZE = 64
+
+# Retries for transient HTTP API failures, backing off 0.3s, 0.6s, 1.2s
+HTTP_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({'POST'})
+)
+
+# PDFium is not thread safe. Text is extracted in a shared pool of worker processes, which also
+# keeps the parsing off request and event loop threads, and calls within one process hold a lock
+PDF_TEXT_WORKERS = os.cpu_count()
+_pdf_text_pool = None
+_pdf_text_pool_lock = threading.Lock()
+_pdfium_lock = threading.Lock()
+
+def _extract_pdf_text(pdf_path: str) -> str:
+    """Embedded text of the first pages of a PDF, raises if PDFium can not read the file"""
+    import pypdfium2 as pdfium
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            pages = []
+            size = 0
+            for page in pdf:
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range().replace('\r\n', '\n'))
+                textpage.close()
+                page.close()
+                size += len(pages[-1])
+                # Later pages of long documents are not needed to read a receipt
+                if size > RECEIPT_TEXT_CHARS:
+                    break
+        finally:
+            pdf.close()
+    return "\n".join(pages)
+
+def _get_pdf_text_pool() -> ProcessPoolExecutor:
+    """The process wide PDF text pool, started on first use"""
+    global _pdf_text_pool
+    with _pdf_text_pool_lock:
+        if _pdf_text_pool is None:
+            _pdf_text_pool = ProcessPoolExecutor(max_workers=PDF_TEXT_WORKERS)
+        return _pdf_text_pool
+
+def _reset_pdf_text_pool():
+    """Drop a broken pool so the next extraction starts a new one"""
+    global _pdf_text_pool
+    with _pdf_text_pool_lock:
+        if _pdf_text_pool is not None:
+            _pdf_text_pool.shutdown(wait=False)
+            _pdf_text_pool = None
+
+# Image bytes as sent to the vision providers, the memory mapped file or a re-encoded copy
+ImageData = Union[bytes, mmap.mmap]
+
 class LLMExtractionService:
     def extract_receipt_data_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
         """
         Extract receipt data from a PDF file by extracting text and passing to LLM
+        PDFs without embedded text are sent as an image of their first page
+        """
+        text = self.extract_text_from_pdf(pdf_path)
+        if not text:
+            return self.extract_receipt_data_from_pdf_image(pdf_path)
+        return self.extract_receipt_data_from_text(text)
+    
+    def extract_receipt_data_from_pdf_image(self, pdf_path: str) -> Dict[str, Any]:
+        """Extract receipt data from the rendered first page of a PDF"""
+        image_path = self.render_first_page(pdf_path)
+        if not image_path:
+            return {}
+        return self.extract_receipt_data_from_image(image_path)
+    
+    def render_first_page(self, pdf_path: str) -> Optional[str]:
+        """
+        Render page 1 of a PDF to a small JPEG, reused while the PDF's mtime is unchanged
+        Returns: the JPEG path, or None if the page could not be rendered
         """
-        import PyPDF2
         try:
-            with open(pdf_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                text = "\n".join(page.extract_text() or '' for page in reader.pages)
+            key = hashlib.blake2b(os.path.abspath(pdf_path).encode(), digest_size=8).hexdigest()
+            image_path = os.path.join(
+                self.config.PREVIEW_FOLDER, f"{key}-{os.stat(pdf_path).st_mtime_ns}.jpg"
+            )
+            if os.path.exists(image_path):
+                return image_path
+            
+            from pdf2image import convert_from_path
+            page = convert_from_path(
+                pdf_path, dpi=self.config.PREVIEW_DPI, first_page=1, last_page=1,
+                use_pdftocairo=PDFTOCAIRO_AVAILABLE
+            )[0]
+            
+            # Write under a private name first so concurrent workers never read a partial JPEG
+            os.makedirs(self.config.PREVIEW_FOLDER, exist_ok=True)
+            temp_path = f"{image_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            page.save(temp_path, 'JPEG', quality=PREVIEW_JPEG_QUALITY, optimize=True)
+            os.replace(temp_path, image_path)
+            
+            logger.info(f"Rendered first page of {pdf_path} to {image_path}")
+            return image_path
+        except Exception as e:
+            logger.error(f"Failed to render first page of PDF: {str(e)}")
+            return None
+    
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extract the embedded text of a PDF, empty if there is none"""
+        try:
+            # Batch pool workers are processes of their own and parse inline
+            if multiprocessing.parent_process() is None:
+                text = _get_pdf_text_pool().submit(_extract_pdf_text, pdf_path).result()
+            else:
+                text = _extract_pdf_text(pdf_path)
             if not text.strip():
                 logger.error(f"No text extracted from PDF: {pdf_path}")
-                return {}
+                return ''
             
-            # Log the extracted text for debugging
             logger.info(f"Extracted text from PDF: {pdf_path}")
-            logger.info(f"Text content: {text}")
+            # Logged lazily, the text is only formatted when DEBUG records are emitted
+            logger.debug("Text content: %s", text)
             
-            return self.extract_receipt_data_from_text(text)
+            return text
+        except BrokenProcessPool:
+            # A worker died inside PDFium, the next call starts a fresh pool
+            _reset_pdf_text_pool()
+            logger.error(f"PDF text worker crashed on: {pdf_path}")
+            return ''
         except Exception as e:
             logger.error(f"Failed to extract text from PDF: {str(e)}")
-            return {}
+            return ''
     """
     LLM-based document extraction service with multiple provider support
     Used as a fallback when OCR fails
@@ -39,46 +304,102 @@ class LLMExtractionService:
     
     def __init__(self):
         self.config = Config()
+        # Reused for every direct HTTP API call so TLS connections are kept alive
+        self.session = self._create_session()
+        self.cache = LLMCache(self.config.LLM_CACHE_PATH, self.config.LLM_CACHE_TTL) if self.config.LLM_CACHE_PATH else None
+        # The async SDK clients are bound to one event loop, kept running in its own thread
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='llm-event-loop', daemon=True).start()
         self._setup_clients()
+        self.hedge_delay = self.config.LLM_HEDGE_DELAY_MS / 1000.0
+    
+    @staticmethod
+    def _create_session() -> requests.Session:
+        """Create the pooled, retrying HTTP session"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=HTTP_RETRY
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def close(self):
+        """Close the pooled HTTP connections of the service and its async clients"""
+        self.session.close()
+        for client in (self.openai_client, self.claude_client):
+            if client:
+                self._run(client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+    
+    def _run(self, coroutine) -> Any:
+        """Run a coroutine on the service's event loop, blocking the calling thread until it is done"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
     
     def _setup_clients(self):
-        """Initialize LLM clients based on available API keys"""
+        """
+        Initialize LLM clients based on available API keys
+        Each SDK is imported only when its key is set, unused SDKs cost no worker start up time or memory
+        """
         self.openai_client = None
         self.gemini_client = None
         self.claude_client = None
+        # Text extraction providers in order of preference
+        self._providers = []
         
         # OpenAI setup
         if hasattr(self.config, 'OPENAI_API_KEY') and self.config.OPENAI_API_KEY:
-            openai.api_key = self.config.OPENAI_API_KEY
-            self.openai_client = openai
+            import openai
+            self.openai_client = openai.AsyncOpenAI(
+                api_key=self.config.OPENAI_API_KEY, max_retries=SDK_MAX_RETRIES, timeout=SDK_TIMEOUT
+            )
+            self._providers.append(ProviderSpec(
+                'OpenAI', self._openai_request, self.openai_client.chat.completions.create,
+                lambda response: response.choices[0].message.content, "messages", _chat_turn, "assistant",
+                asyncio.Semaphore(self.config.LLM_PROVIDER_CONCURRENCY)
+            ))
             logger.info("OpenAI client initialized")
         
         # Google Gemini setup
         if hasattr(self.config, 'GEMINI_API_KEY') and self.config.GEMINI_API_KEY:
+            # The default transports are gRPC (sync) and gRPC asyncio (async), multiplexing concurrent calls over
+            # one HTTP/2 channel each. The model keeps both clients for its lifetime and is shared by all threads.
+            # Naming a transport here would apply it to the async client as well and block the event loop
+            import google.generativeai as genai
             genai.configure(api_key=self.config.GEMINI_API_KEY)
             self.gemini_client = genai.GenerativeModel('gemini-1.5-flash')
+            self._providers.append(ProviderSpec(
+                'Gemini', self._gemini_request, self.gemini_client.generate_content_async,
+                lambda response: response.text, "contents", _gemini_turn, "model",
+                asyncio.Semaphore(self.config.LLM_PROVIDER_CONCURRENCY)
+            ))
             logger.info("Gemini client initialized")
             logger.info(f"GEMINI_API_KEY loaded: {self.config.GEMINI_API_KEY is not None}")
         
         # Anthropic Claude setup
         if hasattr(self.config, 'CLAUDE_API_KEY') and self.config.CLAUDE_API_KEY:
-            self.claude_client = anthropic.Anthropic(api_key=self.config.CLAUDE_API_KEY)
+            import anthropic
+            self.claude_client = anthropic.AsyncAnthropic(
+                api_key=self.config.CLAUDE_API_KEY, max_retries=SDK_MAX_RETRIES, timeout=SDK_TIMEOUT
+            )
+            self._providers.append(ProviderSpec(
+                'Claude', self._claude_request, self.claude_client.messages.create,
+                lambda response: response.content[0].text, "messages", _chat_turn, "assistant",
+                asyncio.Semaphore(self.config.LLM_PROVIDER_CONCURRENCY)
+            ))
             logger.info("Claude client initialized")
 
         # Google Vision setup (just log presence)
         if hasattr(self.config, 'GOOGLE_VISION_API_KEY') and self.config.GOOGLE_VISION_API_KEY:
             logger.info(f"GOOGLE_VISION_API_KEY loaded: {self.config.GOOGLE_VISION_API_KEY is not None}")
 
-    def _extract_with_google_vision(self, image_path: str) -> dict:
+    def _extract_with_google_vision(self, image_data: ImageData) -> dict:
         """Extract text from image using Google Vision API (OCR)"""
-        import base64
-        import requests
         if not hasattr(self.config, 'GOOGLE_VISION_API_KEY') or not self.config.GOOGLE_VISION_API_KEY:
             logger.error("No Google Vision API key configured.")
             return {}
         try:
-            with open(image_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode()
+            encoded_image = binascii.b2a_base64(image_data, newline=False).decode('ascii')
             url = f"https://vision.googleapis.com/v1/images:annotate?key={self.config.GOOGLE_VISION_API_KEY}"
             payload = {
                 "requests": [
@@ -89,11 +410,11 @@ class LLMExtractionService:
                 ]
             }
             logger.info("Calling Google Vision API for OCR...")
-            response = requests.post(url, json=payload)
+            response = self.session.post(url, json=payload)
             logger.info(f"Google Vision API response status: {response.status_code}")
             if response.status_code == 200:
                 result = response.json()
-                logger.info(f"Google Vision API result: {result}")
+                logger.debug("Google Vision API result: %s", result)
                 # Parse the result for text
                 text = result['responses'][0].get('fullTextAnnotation', {}).get('text', '')
                 # Use the existing text extraction logic
@@ -105,50 +426,161 @@ class LLMExtractionService:
             logger.error(f"Google Vision API call failed: {str(e)}")
             return {}
     
-    def extract_receipt_data_from_text(self, text: str) -> Dict[str, Any]:
+    def extract_receipt_data_from_text(self, text: str, prompt: str = None, max_tokens: int = RECEIPT_MAX_TOKENS) -> Any:
         """
         Extract receipt data from text using LLM
-        Tries multiple providers in order of preference
+        Hedges across the available providers and returns the first usable result
+        Single documents are squeezed to PROMPT_HEAD_CHARS + PROMPT_TAIL_CHARS, a custom prompt gets the text as is
         """
+        if prompt is None:
+            prompt = self._get_extraction_prompt()
+            text = squeeze_text(text)
+        key = cache_key(PROMPT_VERSION, 'text', prompt, text)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        
         try:
-            # Try OpenAI first (usually most reliable)
-            if self.openai_client:
-                result = self._extract_with_openai(text)
-                if result:
-                    logger.info("Successfully extracted data using OpenAI")
-                    return result
-            
-            # Try Gemini as fallback
-            if self.gemini_client:
-                result = self._extract_with_gemini(text)
-                if result:
-                    logger.info("Successfully extracted data using Gemini")
-                    return result
-            
-            # Try Claude as final fallback
-            if self.claude_client:
-                result = self._extract_with_claude(text)
-                if result:
-                    logger.info("Successfully extracted data using Claude")
-                    return result
-            
-            logger.error("No LLM providers available or all failed")
-            return {}
+            result = self._run(self._extract_first(text, prompt, max_tokens))
             
         except Exception as e:
             logger.error(f"LLM extraction failed: {str(e)}")
             return {}
+        
+        self._store(key, result)
+        return result
+    
+    def _cached(self, key: bytes) -> Optional[Any]:
+        """Cached extraction result, None on a miss or without a cache"""
+        if not self.cache:
+            return None
+        result = self.cache.get(key)
+        if result is not None:
+            logger.info("Using cached LLM extraction result")
+        return result
+    
+    def _store(self, key: bytes, result: Any):
+        """Cache a successful extraction, empty results are retried next time"""
+        if self.cache and result:
+            self.cache.set(key, result)
+    
+    async def _extract_first(self, text: str, prompt: str, max_tokens: int) -> Any:
+        """
+        Hedged provider calls in preference order
+        The next provider starts after hedge_delay without a result, or as soon as every running call failed.
+        The first call returning data wins and the others are cancelled
+        """
+        providers = list(self._providers)
+        running = {}
+        order = {provider.name: index for index, provider in enumerate(providers)}
+        try:
+            while providers or running:
+                if providers:
+                    provider = providers.pop(0)
+                    running[asyncio.ensure_future(self._extract_with(provider, text, prompt, max_tokens))] = provider.name
+                
+                done, _ = await asyncio.wait(
+                    set(running), timeout=self.hedge_delay if providers else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Preference order breaks ties between calls finishing together
+                for task in sorted(done, key=lambda task: order[running[task]]):
+                    name = running.pop(task)
+                    if task.result():
+                        logger.info(f"Successfully extracted data using {name}")
+                        return task.result()
+        finally:
+            for task in running:
+                task.cancel()
+        
+        logger.error("No LLM providers available or all failed")
+        return {}
+    
+    def extract_receipt_data_from_texts(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Extract several receipts with a single LLM request
+        Falls back to one request per text if the reply does not hold one object per document
+        """
+        # Documents cached from earlier single or batched requests are left out of the request
+        prompt = self._get_extraction_prompt()
+        texts = [squeeze_text(text) for text in texts]
+        keys = [cache_key(PROMPT_VERSION, 'text', prompt, text) for text in texts]
+        results = [self._cached(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        
+        if len(missing) <= 1:
+            for index in missing:
+                results[index] = self.extract_receipt_data_from_text(texts[index])
+            return results
+        
+        documents = "\n".join(
+            f"=== DOCUMENT {number} ===\n{texts[index]}" for number, index in enumerate(missing, 1)
+        )
+        result = self.extract_receipt_data_from_text(
+            documents, self._get_extraction_prompt(len(missing)), max_tokens=RECEIPT_MAX_TOKENS * len(missing)
+        )
+        if isinstance(result, list) and len(result) == len(missing) and all(isinstance(r, dict) for r in result):
+            for index, document_result in zip(missing, result):
+                results[index] = document_result
+                self._store(keys[index], document_result)
+            return results
+        
+        logger.warning(f"Batched extraction of {len(missing)} documents failed, extracting one by one")
+        for index in missing:
+            results[index] = self.extract_receipt_data_from_text(texts[index])
+        return results
     
     def extract_receipt_data_from_image(self, image_path: str) -> Dict[str, Any]:
         """
-        Extract receipt data from image using LLM vision capabilities
+        Extract receipt data from image using LLM vision capabilities, cached by the image bytes
+        The image is memory mapped once and the providers encode straight from the mapping
+        """
+        try:
+            with open(image_path, 'rb') as image_file, \
+                    mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as image_data:
+                key = cache_key(PROMPT_VERSION, 'image', image_data)
+                cached = self._cached(key)
+                if cached is not None:
+                    return cached
+                
+                result = self._extract_from_image_uncached(image_path, self._shrink_image(image_path, image_data))
+        except (OSError, ValueError) as e:  # empty files can not be mapped
+            logger.error(f"LLM image extraction failed: {str(e)}")
+            return {}
+        
+        self._store(key, result)
+        return result
+    
+    @staticmethod
+    def _shrink_image(image_path: str, image_data: mmap.mmap) -> ImageData:
+        """
+        Downscale large images to VISION_MAX_EDGE and re-encode them as JPEG
+        Uploads get smaller and the vision models bill fewer pixels, small images are sent as they are
         """
+        if len(image_data) <= VISION_REENCODE_BYTES:
+            return image_data
+        try:
+            with Image.open(image_path) as image:
+                image.thumbnail((VISION_MAX_EDGE, VISION_MAX_EDGE), Image.LANCZOS)
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=PREVIEW_JPEG_QUALITY, optimize=True)
+        except Exception as e:
+            logger.warning(f"Could not re-encode image {image_path}, sending it unchanged: {str(e)}")
+            return image_data
+        
+        reencoded = buffer.getvalue()
+        logger.info(f"Re-encoded image {image_path} from {len(image_data)} to {len(reencoded)} bytes")
+        return reencoded if len(reencoded) < len(image_data) else image_data
+    
+    def _extract_from_image_uncached(self, image_path: str, image_data: ImageData) -> Dict[str, Any]:
+        """Try the vision providers in order of preference"""
         try:
             # Try OpenAI Vision first
             if self.openai_client:
                 logger.info(f"Calling OpenAI Vision API for image: {image_path}")
-                result = self._extract_from_image_openai(image_path)
-                logger.info(f"OpenAI Vision API result: {result}")
+                result = self._run(self._extract_from_image_openai(image_data))
+                logger.debug("OpenAI Vision API result: %s", result)
                 if result:
                     logger.info("Successfully extracted data from image using OpenAI Vision")
                     return result
@@ -156,8 +588,8 @@ class LLMExtractionService:
             # Try Gemini Vision
             if self.gemini_client:
                 logger.info(f"Calling Gemini Vision API for image: {image_path}")
-                result = self._extract_from_image_gemini(image_path)
-                logger.info(f"Gemini Vision API result: {result}")
+                result = self._run(self._extract_from_image_gemini(image_data))
+                logger.debug("Gemini Vision API result: %s", result)
                 if result:
                     logger.info("Successfully extracted data from image using Gemini Vision")
                     return result
@@ -165,8 +597,8 @@ class LLMExtractionService:
             # Try Google Vision as final fallback
             if hasattr(self.config, 'GOOGLE_VISION_API_KEY') and self.config.GOOGLE_VISION_API_KEY:
                 logger.info(f"Calling Google Vision API for image: {image_path}")
-                result = self._extract_with_google_vision(image_path)
-                logger.info(f"Google Vision API OCR result: {result}")
+                result = self._extract_with_google_vision(image_data)
+                logger.debug("Google Vision API OCR result: %s", result)
                 if result:
                     logger.info("Successfully extracted data from image using Google Vision API")
                     return result
@@ -178,116 +610,91 @@ class LLMExtractionService:
             logger.error(f"LLM image extraction failed: {str(e)}")
             return {}
     
-    def _get_extraction_prompt(self) -> str:
-        """Get the standardized prompt for receipt data extraction"""
-        return """
-Act as a receipt data extraction expert. You MUST carefully analyze ANY transaction document (receipts, invoices, tickets, passes) and extract ALL available information with high accuracy.
-
-CRITICAL INSTRUCTIONS FOR MERCHANT NAME:
-1. Look for business/organization names at the TOP of the document
-2. Accept ANY type of merchant: restaurants ("APPLEBEE'S"), stores ("WALMART"), transit systems ("San Francisco Transit"), services, government agencies
-3. For transit passes/tickets: use city name + "Transit" or the transit authority name
-4. For government/public services: use the agency or location name
-5. NEVER return null for merchant_name - always find SOME identifying name/organization
-6. If no clear business name, use location or service provider name
-
-DOCUMENT TYPE RECOGNITION:
-- Restaurant receipts: Business name at top, food items, tax, total
-- Retail receipts: Store name, product items, tax, total  
-- Transit passes/tickets: Transit authority, pass type, zones, fare amount
-- Service receipts: Service provider, description, amount
-- Parking tickets: Location, duration, fee
-
-EXTRACTION RULES:
-- merchant_name: ANY business, organization, or service provider name (REQUIRED)
-- total_amount: Final amount paid (look for "Total", "Amount Due", fare, fee)
-- tax_amount: Tax if specified (may not apply to transit/government)
-- subtotal: Amount before tax if shown
-- purchased_at: Transaction date in YYYY-MM-DD format
-- payment_method: Payment type if mentioned
-- items: Services, products, or pass types with prices
-
-EXAMPLES:
-Restaurant: {"merchant_name": "APPLEBEE'S", "total_amount": 128.23, "purchased_at": "2018-12-01"}
-Transit: {"merchant_name": "San Francisco Transit", "total_amount": 7.50, "purchased_at": "2018-07-23", "items": [{"name": "DAY PASS ZONE 1", "price": 7.50}]}
-Retail: {"merchant_name": "WALMART", "total_amount": 45.67, "purchased_at": "2024-01-15"}
-
-Return ONLY a valid JSON object. Use null only if information is completely absent from the document.
-
-Document text:
-"""
+    def _get_extraction_prompt(self, document_count: int = 1) -> str:
+        """Get the standardized prompt for receipt data extraction (of several documents if document_count > 1)"""
+        if document_count > 1:
+            return _multi_document_prompt(document_count)
+        return EXTRACTION_PROMPT
     
-    def _extract_with_openai(self, text: str) -> Optional[Dict[str, Any]]:
-        """Extract using OpenAI GPT"""
-        try:
-            response = self.openai_client.ChatCompletion.create(
-                model="gpt-4o-mini",  # Cost-effective model
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a receipt data extraction expert. Extract information accurately and return only valid JSON."
-                    },
-                    {
-                        "role": "user",
-                        "content": self._get_extraction_prompt() + text
-                    }
-                ],
-                max_tokens=500,
-                temperature=0.1
-            )
-            
-            result_text = response.choices[0].message.content.strip()
-            return json.loads(result_text)
-            
-        except Exception as e:
-            logger.error(f"OpenAI extraction failed: {str(e)}")
-            return None
+    @staticmethod
+    def _openai_request(text: str, prompt: str, max_tokens: int = RECEIPT_MAX_TOKENS) -> Dict[str, Any]:
+        """Chat completion parameters"""
+        return {
+            "model": "gpt-4o-mini",  # Cost-effective model
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are a receipt data extraction expert. Extract information accurately and return only valid JSON."
+                },
+                {
+                    "role": "user",
+                    "content": prompt + text
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.1,
+            # Structured output returns a single object, multi-document prompts ask for an array
+            **({"response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "receipt", "strict": True, "schema": RECEIPT_JSON_SCHEMA}
+            }} if prompt == EXTRACTION_PROMPT else {})
+        }
     
-    def _extract_with_gemini(self, text: str) -> Optional[Dict[str, Any]]:
-        """Extract using Google Gemini"""
-        try:
-            prompt = self._get_extraction_prompt() + text
-            response = self.gemini_client.generate_content(prompt)
-            
-            result_text = response.text.strip()
-            # Clean up response if it has markdown formatting
-            if result_text.startswith('```json'):
-                result_text = result_text.replace('```json', '').replace('```', '').strip()
-            
-            return json.loads(result_text)
-            
-        except Exception as e:
-            logger.error(f"Gemini extraction failed: {str(e)}")
-            return None
+    @staticmethod
+    def _gemini_request(text: str, prompt: str, max_tokens: int = RECEIPT_MAX_TOKENS) -> Dict[str, Any]:
+        """generate_content arguments"""
+        return {
+            "contents": [_gemini_turn("user", prompt + text)],
+            "generation_config": {"max_output_tokens": max_tokens}
+        }
+    
+    @staticmethod
+    def _claude_request(text: str, prompt: str, max_tokens: int = RECEIPT_MAX_TOKENS) -> Dict[str, Any]:
+        """Message parameters"""
+        return {
+            "model": "claude-3-haiku-20240307",  # Cost-effective model
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt + text
+                }
+            ]
+        }
     
-    def _extract_with_claude(self, text: str) -> Optional[Dict[str, Any]]:
-        """Extract using Anthropic Claude"""
+    async def _extract_with(self, provider: ProviderSpec, text: str, prompt: str, max_tokens: int) -> Optional[Any]:
+        """
+        Extract with one provider, within its concurrency limit
+        An unusable reply is answered with its error and asked again, up to FEEDBACK_RETRIES times
+        """
         try:
-            response = self.claude_client.messages.create(
-                model="claude-3-haiku-20240307",  # Cost-effective model
-                max_tokens=500,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": self._get_extraction_prompt() + text
-                    }
-                ]
-            )
-            
-            result_text = response.content[0].text.strip()
-            return json.loads(result_text)
+            async with provider.limit:
+                request = provider.request(text, prompt, max_tokens)
+                conversation = request[provider.conversation_key]
+                for attempt in range(FEEDBACK_RETRIES + 1):
+                    response = await provider.call(**{**request, provider.conversation_key: conversation})
+                    result_text = provider.reply(response).strip()
+                    try:
+                        return parse_extraction(result_text)
+                    except ValueError as e:
+                        if attempt == FEEDBACK_RETRIES:
+                            raise
+                        logger.warning(f"{provider.name} reply rejected, asking again: {str(e)}")
+                        conversation = conversation + [
+                            provider.turn(provider.reply_role, result_text),
+                            provider.turn("user", f"Your output had error: {str(e)}. Return valid JSON only."),
+                        ]
             
         except Exception as e:
-            logger.error(f"Claude extraction failed: {str(e)}")
+            logger.error(f"{provider.name} extraction failed: {str(e)}")
             return None
     
-    def _extract_from_image_openai(self, image_path: str) -> Optional[Dict[str, Any]]:
+    async def _extract_from_image_openai(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
         """Extract from image using OpenAI Vision"""
         try:
-            with open(image_path, 'rb') as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+            encoded_image = binascii.b2a_base64(image_data, newline=False).decode('ascii')
             
-            response = self.openai_client.ChatCompletion.create(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {
@@ -295,47 +702,43 @@ Document text:
                         "content": [
                             {
                                 "type": "text",
-                                "text": "Extract receipt data from this image and return as JSON: " + self._get_extraction_prompt()
+                                "text": OPENAI_VISION_PROMPT
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
+                                    "url": f"data:image/jpeg;base64,{encoded_image}"
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=500
+                max_tokens=RECEIPT_MAX_TOKENS
             )
             
             result_text = response.choices[0].message.content.strip()
-            return json.loads(result_text)
+            return parse_llm_json(result_text)
             
         except Exception as e:
             logger.error(f"OpenAI Vision extraction failed: {str(e)}")
             return None
     
-    def _extract_from_image_gemini(self, image_path: str) -> Optional[Dict[str, Any]]:
+    async def _extract_from_image_gemini(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
         """Extract from image using Gemini Vision"""
         try:
-            with open(image_path, 'rb') as image_file:
-                image_data = image_file.read()
-            
-            # Upload image to Gemini
+            # Upload image to Gemini (the request protobuf needs its own bytes copy)
             image_part = {
                 "mime_type": "image/jpeg",
-                "data": image_data
+                "data": bytes(image_data)
             }
             
-            prompt = "Extract receipt data from this image: " + self._get_extraction_prompt()
-            response = self.gemini_client.generate_content([prompt, image_part])
+            prompt = GEMINI_VISION_PROMPT
+            response = await self.gemini_client.generate_content_async(
+                [prompt, image_part], generation_config={"max_output_tokens": RECEIPT_MAX_TOKENS}
+            )
             
             result_text = response.text.strip()
-            if result_text.startswith('```json'):
-                result_text = result_text.replace('```json', '').replace('```', '').strip()
-            
-            return json.loads(result_text)
+            return parse_llm_json(result_text)
             
         except Exception as e:
             logger.error(f"Gemini Vision extraction failed: {str(e)}")
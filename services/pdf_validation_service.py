@@ -5,6 +5,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Message returned alongside a successful validation
+VALID_PDF_MESSAGE = "Valid PDF"
+
+# Bytes searched for the %PDF- header and the %%EOF trailer, the same windows PyPDF2 uses
+PDF_MARKER_WINDOW = 1024
+
 class PDFValidationService:
     
     @staticmethod
@@ -14,23 +20,20 @@ class PDFValidationService:
         Returns: (is_valid, error_message)
         """
         try:
-            # Debug logging
             logger.info(f"Validating PDF file: {file_path}")
-            logger.info(f"File exists check: {os.path.exists(file_path)}")
             
-            # Check if file exists
-            if not os.path.exists(file_path):
+            # One stat call covers existence and size
+            try:
+                file_size = os.stat(file_path).st_size
+            except FileNotFoundError:
                 logger.error(f"File does not exist at path: {file_path}")
-                # Try to list the directory to see what's there
-                try:
+                # List the directory to see what's there, only when debugging
+                if logger.isEnabledFor(logging.DEBUG):
                     directory = os.path.dirname(file_path)
-                    if os.path.exists(directory):
-                        files_in_dir = os.listdir(directory)
-                        logger.info(f"Files in directory {directory}: {files_in_dir}")
-                    else:
-                        logger.error(f"Directory does not exist: {directory}")
-                except Exception as dir_e:
-                    logger.error(f"Error checking directory: {str(dir_e)}")
+                    try:
+                        logger.debug(f"Files in directory {directory}: {os.listdir(directory)}")
+                    except OSError as dir_e:
+                        logger.debug(f"Error checking directory {directory}: {str(dir_e)}")
                 return False, "File does not exist"
             
             # Check file extension
@@ -38,11 +41,19 @@ class PDFValidationService:
                 return False, "File is not a PDF"
             
             # Check if file is not empty
-            if os.path.getsize(file_path) == 0:
+            if file_size == 0:
                 return False, "File is empty"
             
             # Try to open and read PDF
             with open(file_path, 'rb') as file:
+                # Reject files without the PDF markers before parsing anything
+                if b'%PDF-' not in file.read(PDF_MARKER_WINDOW):
+                    return False, "Invalid PDF format: missing %PDF- header"
+                file.seek(max(file_size - PDF_MARKER_WINDOW, 0))
+                if b'%%EOF' not in file.read():
+                    return False, "Invalid PDF format: EOF marker not found"
+                file.seek(0)
+                
                 try:
                     pdf_reader = PyPDF2.PdfReader(file)
                     
@@ -50,12 +61,12 @@ class PDFValidationService:
                     if len(pdf_reader.pages) == 0:
                         return False, "PDF has no pages"
                     
-                    # Try to read first page to ensure it's not corrupted
-                    first_page = pdf_reader.pages[0]
-                    _ = first_page.extract_text()
+                    # Load the first page to ensure the page tree is not corrupted. Its text is
+                    # not extracted here, that is the slowest PyPDF2 call and extraction reads it anyway
+                    _ = pdf_reader.pages[0]
                     
                     logger.info(f"PDF validation successful: {file_path}")
-                    return True, "Valid PDF"
+                    return True, VALID_PDF_MESSAGE
                     
                 except PyPDF2.errors.PdfReadError as e:
                     return False, f"Invalid PDF format: {str(e)}"
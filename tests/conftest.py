@@ -0,0 +1,14 @@
+import os
+import pytest
+from flask import Flask
+from config import database
+
+@pytest.fixture
+def app(tmp_path):
+    """Minimal app bound to a throwaway SQLite database"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp_path, 'receipts.db')
+    database.init_app(app)
+    
+    with app.app_context():
+        yield app
@@ -0,0 +1,50 @@
+import queue
+import threading
+import types
+from services import batch_processing_service
+from services.batch_processing_service import BatchProcessingService
+
+class FakeFileService:
+    """Validates every PDF and extracts it after a short delay"""
+    
+    def validate_file(self, file_path):
+        return True, 'Valid PDF'
+    
+    def extract_receipt_data(self, file_path):
+        threading.Event().wait(0.01)
+        return True, {'merchant_name': file_path}, None
+
+class TestPipelineExtractions:
+    
+    def test_early_exit_stops_every_stage(self, tmp_path, monkeypatch):
+        """Test leaving the iterator after the first result joins all stage threads and empties the queues"""
+        queues = []
+        
+        class RecordingQueue(queue.Queue):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                queues.append(self)
+        
+        monkeypatch.setattr(batch_processing_service, 'queue', types.SimpleNamespace(
+            Queue=RecordingQueue, Empty=queue.Empty
+        ))
+        service = BatchProcessingService(str(tmp_path), file_service=FakeFileService())
+        files = [(f'{index}.pdf', None) for index in range(100)]
+        
+        for index, extraction in service._pipeline_extractions(files, workers=2):
+            break
+        
+        assert extraction[2] is True
+        assert not [thread for thread in threading.enumerate() if thread.name in ('pdf-validate', 'pdf-extract')]
+        assert len(queues) == 3
+        assert all(stage_queue.empty() for stage_queue in queues)
+    
+    def test_every_file_is_yielded_once(self, tmp_path):
+        """Test a full run yields one extraction per file"""
+        service = BatchProcessingService(str(tmp_path), file_service=FakeFileService())
+        files = [(f'{index}.pdf', None) for index in range(20)]
+        
+        indexes = [index for index, _ in service._pipeline_extractions(files, workers=3)]
+        
+        assert sorted(indexes) == list(range(20))
+        assert not [thread for thread in threading.enumerate() if thread.name in ('pdf-validate', 'pdf-extract')]
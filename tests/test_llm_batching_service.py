@@ -0,0 +1,84 @@
+import threading
+import pytest
+from services.llm_batching_service import BatchingLLMClient
+
+class FakeLLMService:
+    """Records the calls BatchingLLMClient makes, PDFs named 'scan*' have no text"""
+    
+    def __init__(self, error: Exception = None, barrier: threading.Barrier = None):
+        self.error = error
+        self.barrier = barrier
+        self.text_batches = []
+        self.image_paths = []
+    
+    def extract_text_from_pdf(self, pdf_path):
+        return '' if pdf_path.startswith('scan') else f'text of {pdf_path}'
+    
+    def extract_receipt_data_from_texts(self, texts):
+        self.text_batches.append(texts)
+        if self.barrier:
+            self.barrier.wait()
+        if self.error:
+            raise self.error
+        return [{'merchant_name': text} for text in texts]
+    
+    def extract_receipt_data_from_pdf_image(self, pdf_path):
+        self.image_paths.append(pdf_path)
+        return {'merchant_name': f'image of {pdf_path}'}
+
+class TestBatchingLLMClient:
+
+    def test_full_batch_is_sent_without_waiting(self):
+        """Test a batch is flushed as soon as max_batch PDFs are queued"""
+        llm_service = FakeLLMService()
+        client = BatchingLLMClient(llm_service, max_batch=2, max_wait_ms=60_000)
+        
+        futures = [client.submit('a.pdf'), client.submit('b.pdf')]
+        
+        assert [future.result(timeout=5) for future in futures] == [
+            {'merchant_name': 'text of a.pdf'}, {'merchant_name': 'text of b.pdf'}
+        ]
+        assert llm_service.text_batches == [['text of a.pdf', 'text of b.pdf']]
+    
+    def test_partial_batch_is_sent_after_max_wait(self):
+        """Test a lone PDF is flushed once it has waited max_wait_ms"""
+        llm_service = FakeLLMService()
+        client = BatchingLLMClient(llm_service, max_batch=8, max_wait_ms=20)
+        
+        assert client.extract_receipt_data_from_pdf('a.pdf') == {'merchant_name': 'text of a.pdf'}
+        assert llm_service.text_batches == [['text of a.pdf']]
+    
+    def test_pdfs_without_text_go_to_vision(self):
+        """Test PDFs without text are kept out of the text request and read as images"""
+        llm_service = FakeLLMService()
+        client = BatchingLLMClient(llm_service, max_batch=2, max_wait_ms=60_000)
+        
+        text_future, scan_future = client.submit('a.pdf'), client.submit('scan.pdf')
+        
+        assert text_future.result(timeout=5) == {'merchant_name': 'text of a.pdf'}
+        assert scan_future.result(timeout=5) == {'merchant_name': 'image of scan.pdf'}
+        assert llm_service.text_batches == [['text of a.pdf']]
+        assert llm_service.image_paths == ['scan.pdf']
+    
+    def test_failed_request_fails_every_future(self):
+        """Test an LLM error is raised by every PDF of the batch"""
+        llm_service = FakeLLMService(error=RuntimeError('rate limited'))
+        client = BatchingLLMClient(llm_service, max_batch=2, max_wait_ms=60_000)
+        
+        futures = [client.submit('a.pdf'), client.submit('b.pdf')]
+        
+        for future in futures:
+            with pytest.raises(RuntimeError, match='rate limited'):
+                future.result(timeout=5)
+    
+    def test_batches_are_sent_concurrently(self):
+        """Test a second batch is sent while the first request is still in flight"""
+        # Each request waits until both are in flight, a serial flush would break the barrier
+        llm_service = FakeLLMService(barrier=threading.Barrier(2, timeout=5))
+        client = BatchingLLMClient(llm_service, max_batch=1, max_wait_ms=60_000, max_concurrent=2)
+        
+        futures = [client.submit('a.pdf'), client.submit('b.pdf')]
+        
+        assert [future.result(timeout=10) for future in futures] == [
+            {'merchant_name': 'text of a.pdf'}, {'merchant_name': 'text of b.pdf'}
+        ]
@@ -0,0 +1,62 @@
+import pytest
+from config.config import Config
+from repositories.receipt_repository import ReceiptRepository
+from repositories.receipt_file_repository import ReceiptFileRepository
+from routes.receipt_routes import receipt_bp
+from utils.json_provider import ORJSONProvider
+
+@pytest.fixture
+def client(app):
+    """Test client for the receipt endpoints"""
+    app.json = ORJSONProvider(app)
+    app.config['MAX_JSON_LENGTH'] = Config.MAX_JSON_LENGTH
+    app.register_blueprint(receipt_bp, url_prefix='/api')
+    return app.test_client()
+
+@pytest.fixture
+def receipt(app):
+    """A stored receipt with its file record"""
+    receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+    return ReceiptRepository.create(file_id=receipt_file['id'], file_path='/tmp/a.pdf', merchant_name='CVS')
+
+class TestReceiptCaching:
+    
+    def test_receipt_is_sent_with_etag(self, client, receipt):
+        """Test a receipt response carries a weak ETag and private caching headers"""
+        response = client.get(f"/api/receipts/{receipt['id']}")
+        
+        assert response.status_code == 200
+        assert response.get_json()['receipt']['merchant_name'] == 'CVS'
+        assert response.headers['ETag'].startswith('W/')
+        assert 'private' in response.headers['Cache-Control']
+    
+    def test_matching_etag_is_not_modified(self, client, receipt):
+        """Test If-None-Match with the current ETag returns 304 without a body"""
+        etag = client.get(f"/api/receipts/{receipt['id']}").headers['ETag']
+        
+        response = client.get(f"/api/receipts/{receipt['id']}", headers={'If-None-Match': etag})
+        
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+    
+    def test_update_changes_etag_within_the_same_second(self, client, receipt):
+        """Test an edit right after a read is not hidden by the one second updated_at resolution"""
+        etag = client.get(f"/api/receipts/{receipt['id']}").headers['ETag']
+        client.put(f"/api/receipts/{receipt['id']}", json={'merchant_name': 'Walgreens'})
+        
+        response = client.get(f"/api/receipts/{receipt['id']}", headers={'If-None-Match': etag})
+        
+        assert response.status_code == 200
+        assert response.get_json()['receipt']['merchant_name'] == 'Walgreens'
+        assert response.headers['ETag'] != etag
+    
+    def test_receipt_list_is_not_modified_until_a_receipt_changes(self, client, receipt):
+        """Test the receipt list ETag follows the listed content"""
+        etag = client.get('/api/receipts').headers['ETag']
+        
+        assert client.get('/api/receipts', headers={'If-None-Match': etag}).status_code == 304
+        
+        client.put(f"/api/receipts/{receipt['id']}", json={'merchant_name': 'Walgreens'})
+        
+        assert client.get('/api/receipts', headers={'If-None-Match': etag}).status_code == 200
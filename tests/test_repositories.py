@@ -0,0 +1,238 @@
+import pytest
+from repositories.receipt_repository import ReceiptRepository
+from repositories.receipt_file_repository import ReceiptFileRepository
+from repositories.batch_job_repository import BatchJobRepository
+from services.file_processing_service import FileProcessingService
+from utils.helpers import encode_cursor, uuid7
+
+class TestReceiptFileRepository:
+    
+    def test_create_returns_new_record(self, app):
+        """Test receipt file creation"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        
+        assert receipt_file['file_name'] == 'a.pdf'
+        assert receipt_file['file_path'] == '/tmp/a.pdf'
+        assert not receipt_file['is_valid']
+        assert not receipt_file['is_processed']
+    
+    def test_create_existing_file_name_updates_path(self, app):
+        """Test duplicate file names reuse the existing record"""
+        first = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        second = ReceiptFileRepository.create('a.pdf', '/tmp/moved/a.pdf')
+        
+        assert second['id'] == first['id']
+        assert second['file_path'] == '/tmp/moved/a.pdf'
+        assert len(ReceiptFileRepository.get_all()) == 1
+    
+    def test_get_by_file_names_keys_records_by_name(self, app):
+        """Test bulk lookup skips unknown names"""
+        ReceiptFileRepository.create_many([('a.pdf', '/tmp/a.pdf'), ('b.pdf', '/tmp/b.pdf')])
+        
+        records = ReceiptFileRepository.get_by_file_names(['a.pdf', 'b.pdf', 'missing.pdf', 'a.pdf'])
+        
+        assert sorted(records) == ['a.pdf', 'b.pdf']
+        assert records['b.pdf']['file_path'] == '/tmp/b.pdf'
+    
+    def test_updates_return_updated_record(self, app):
+        """Test update_validation and mark_processed return the written row"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        
+        validated = ReceiptFileRepository.update_validation(receipt_file['id'], False, 'Not a PDF')
+        processed = ReceiptFileRepository.mark_processed(receipt_file['id'])
+        
+        assert validated['invalid_reason'] == 'Not a PDF'
+        assert processed['is_processed']
+        assert ReceiptFileRepository.mark_processed('missing') is None
+    
+    def test_update_validation_records_file_signature(self, app):
+        """Test a recorded validation is only reused while mtime and size match"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        
+        validated = ReceiptFileRepository.update_validation(receipt_file['id'], False, 'Not a PDF', (1000, 42))
+        
+        assert (validated['validated_mtime'], validated['validated_size']) == (1000, 42)
+        assert FileProcessingService.recorded_validation(validated, '/tmp/a.pdf', (1000, 42)) == (False, 'Not a PDF')
+        assert FileProcessingService.recorded_validation(validated, '/tmp/a.pdf', (2000, 42)) is None
+        assert FileProcessingService.recorded_validation(validated, '/tmp/b.pdf', (1000, 42)) is None
+    
+    def test_processed_files_are_found_by_content_hash(self, app):
+        """Test content hash lookup only returns processed files"""
+        ReceiptFileRepository.create_many([('a.pdf', '/tmp/a.pdf', 'aa' * 16), ('b.pdf', '/tmp/b.pdf', 'bb' * 16)])
+        ReceiptFileRepository.create_many([('a.pdf', '/tmp/a.pdf')])
+        ReceiptFileRepository.mark_processed_many([ReceiptFileRepository.get_by_file_name('a.pdf')['id']])
+        
+        records = ReceiptFileRepository.get_processed_by_content_hashes(['aa' * 16, 'bb' * 16, 'cc' * 16])
+        
+        assert list(records) == ['aa' * 16]
+        assert records['aa' * 16]['file_name'] == 'a.pdf'
+    
+    def test_ids_are_time_ordered_uuids(self, app):
+        """Test ids round trip as uuid.UUID and accept their string form"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        
+        assert receipt_file['id'].version == 7
+        assert ReceiptFileRepository.get_by_id(str(receipt_file['id']))['file_name'] == 'a.pdf'
+        assert ReceiptFileRepository.get_by_id('not-a-uuid') is None
+
+class TestReceiptRepository:
+    
+    def test_create_and_update_for_same_file(self, app):
+        """Test receipt upsert keyed by file id"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        
+        receipt = ReceiptRepository.create(
+            file_id=receipt_file['id'],
+            file_path=receipt_file['file_path'],
+            merchant_name='CVS',
+            total_amount=12.5,
+            items=[{'name': 'ignored'}]
+        )
+        updated = ReceiptRepository.create(
+            file_id=receipt_file['id'],
+            file_path=receipt_file['file_path'],
+            total_amount=13.0
+        )
+        
+        assert updated['id'] == receipt['id']
+        assert updated['merchant_name'] == 'CVS'
+        assert updated['total_amount'] == 13.0
+        assert len(ReceiptRepository.get_all()) == 1
+    
+    def test_save_extraction_marks_file_processed(self, app):
+        """Test the receipt upsert and processed flag are written together"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        
+        first = ReceiptRepository.save_extraction(str(receipt_file['id']), '/tmp/a.pdf', merchant_name='CVS')
+        second = ReceiptRepository.save_extraction(receipt_file['id'], '/tmp/a.pdf', total_amount=4.0)
+        
+        assert second['id'] == first['id']
+        assert second['merchant_name'] == 'CVS'
+        assert ReceiptFileRepository.get_by_id(receipt_file['id'])['is_processed']
+    
+    def test_update_returns_updated_record(self, app):
+        """Test update returns the row and ignores unknown fields"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        receipt = ReceiptRepository.create(file_id=receipt_file['id'], file_path='/tmp/a.pdf', merchant_name='CVS')
+        
+        updated = ReceiptRepository.update(receipt['id'], merchant_name='Ross', items=[])
+        
+        assert updated['merchant_name'] == 'Ross'
+        assert ReceiptRepository.update(receipt['id'])['merchant_name'] == 'Ross'
+    
+    def test_create_many_keeps_existing_receipt_ids(self, app):
+        """Test bulk receipt creation for new and already extracted files"""
+        ReceiptFileRepository.create_many([('a.pdf', '/tmp/a.pdf'), ('b.pdf', '/tmp/b.pdf')])
+        file_a = ReceiptFileRepository.get_by_file_name('a.pdf')
+        file_b = ReceiptFileRepository.get_by_file_name('b.pdf')
+        existing = ReceiptRepository.create(file_id=file_a['id'], file_path='/tmp/a.pdf', merchant_name='CVS')
+        
+        receipt_ids = ReceiptRepository.create_many([
+            {'file_id': file_a['id'], 'file_path': '/tmp/a.pdf', 'total_amount': 5.0},
+            {'file_id': file_b['id'], 'file_path': '/tmp/b.pdf', 'merchant_name': 'Ross'},
+        ])
+        ReceiptFileRepository.mark_processed_many([file_a['id'], file_b['id']])
+        
+        assert receipt_ids[file_a['id']] == existing['id']
+        assert ReceiptRepository.get_by_id(existing['id'])['merchant_name'] == 'CVS'
+        assert ReceiptRepository.get_by_id(receipt_ids[file_b['id']])['merchant_name'] == 'Ross'
+        assert all(f['is_processed'] for f in ReceiptFileRepository.get_all())
+    
+    def test_create_many_large_batch_keeps_indexes(self, app):
+        """Test a bulk insert spanning several chunks writes every row and keeps the secondary indexes"""
+        from config.database import get_db_connection, BULK_CHUNK_SIZE, SECONDARY_INDEXES
+        
+        rows = [(f'{i}.pdf', f'/tmp/{i}.pdf') for i in range(BULK_CHUNK_SIZE + 1)]
+        ReceiptFileRepository.create_many(rows)
+        ReceiptRepository.create_many(
+            {'file_id': f['id'], 'file_path': f['file_path']} for f in ReceiptFileRepository.get_all()
+        )
+        
+        indexes = {name for name, in get_db_connection().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'receipt'"
+        )}
+        assert set(SECONDARY_INDEXES['receipt']) <= indexes
+        assert len(ReceiptRepository.get_all()) == BULK_CHUNK_SIZE + 1
+    
+    def test_get_by_merchant_matches_word_prefixes(self, app):
+        """Test merchant search through the full-text index stays in sync with writes"""
+        ReceiptFileRepository.create_many([('a.pdf', '/tmp/a.pdf'), ('b.pdf', '/tmp/b.pdf')])
+        file_a = ReceiptFileRepository.get_by_file_name('a.pdf')
+        file_b = ReceiptFileRepository.get_by_file_name('b.pdf')
+        receipt = ReceiptRepository.create(file_id=file_a['id'], file_path='/tmp/a.pdf', merchant_name='Best Buy')
+        ReceiptRepository.create(file_id=file_b['id'], file_path='/tmp/b.pdf', merchant_name='Café "Rouge"')
+        
+        assert [r['id'] for r in ReceiptRepository.get_by_merchant('best b')] == [receipt['id']]
+        assert len(ReceiptRepository.get_by_merchant('cafe "rouge')) == 1
+        
+        ReceiptRepository.update(receipt['id'], merchant_name='Target')
+        assert ReceiptRepository.get_by_merchant('best') == []
+        ReceiptRepository.delete(receipt['id'])
+        assert ReceiptRepository.get_by_merchant('target') == []
+    
+    def test_stats_are_counted_in_sql(self, app):
+        """Test file status counts and merchant histogram"""
+        ReceiptFileRepository.create_many([(f'{i}.pdf', f'/tmp/{i}.pdf') for i in range(3)])
+        files = ReceiptFileRepository.get_all()
+        ReceiptRepository.create_many([
+            {'file_id': files[0]['id'], 'file_path': '/tmp/0.pdf', 'merchant_name': 'CVS'},
+            {'file_id': files[1]['id'], 'file_path': '/tmp/1.pdf'},
+        ])
+        ReceiptFileRepository.mark_processed_many([files[0]['id'], files[1]['id']])
+        
+        assert ReceiptFileRepository.count_stats() == {'total': 3, 'valid': 2, 'processed': 2}
+        assert ReceiptRepository.count_by_merchant() == {'CVS': 1, 'Unknown': 1}
+    
+    def test_get_page_walks_all_receipts(self, app):
+        """Test keyset pagination returns every receipt exactly once"""
+        ReceiptFileRepository.create_many((f'{i}.pdf', f'/tmp/{i}.pdf') for i in range(5))
+        ReceiptRepository.create_many(
+            {'file_id': f['id'], 'file_path': f['file_path']} for f in ReceiptFileRepository.get_all()
+        )
+        
+        seen = []
+        receipts, cursor = ReceiptRepository.get_page(limit=2)
+        seen.extend(receipts)
+        while cursor:
+            receipts, cursor = ReceiptRepository.get_page(cursor, limit=2)
+            seen.extend(receipts)
+        
+        assert len(seen) == 5
+        assert len({receipt['id'] for receipt in seen}) == 5
+        assert 'raw_text' not in seen[0]
+    
+    def test_get_page_rejects_forged_cursor(self, app):
+        """Test a cursor with values SQLite cannot bind is rejected as invalid"""
+        cursor = encode_cursor({'x': 1}, str(uuid7()))
+        
+        with pytest.raises(ValueError):
+            ReceiptRepository.get_page(cursor)
+
+class TestBatchJobRepository:
+    
+    def test_job_result_round_trips_as_json(self, app):
+        """Test a finished job stores its summary and the ids it contains"""
+        receipt_file = ReceiptFileRepository.create('a.pdf', '/tmp/a.pdf')
+        job = BatchJobRepository.create('process')
+        
+        BatchJobRepository.update_status(job['id'], 'running')
+        BatchJobRepository.update_status(job['id'], 'completed', {'details': [{'file_id': receipt_file['id']}]})
+        stored = BatchJobRepository.get_by_id(str(job['id']))
+        
+        assert job['status'] == 'queued'
+        assert stored['status'] == 'completed'
+        assert stored['result'] == {'details': [{'file_id': str(receipt_file['id'])}]}
+        assert BatchJobRepository.get_by_id('missing') is None
+    
+    def test_fail_unfinished_only_touches_queued_and_running_jobs(self, app):
+        """Test jobs interrupted by a restart are failed and finished jobs are kept"""
+        queued = BatchJobRepository.create('process')
+        running = BatchJobRepository.create('process')
+        completed = BatchJobRepository.create('process')
+        BatchJobRepository.update_status(running['id'], 'running')
+        BatchJobRepository.update_status(completed['id'], 'completed', {'details': []})
+        
+        assert BatchJobRepository.fail_unfinished('Interrupted') == 2
+        assert BatchJobRepository.get_by_id(str(queued['id']))['status'] == 'failed'
+        assert BatchJobRepository.get_by_id(str(running['id']))['error'] == 'Interrupted'
+        assert BatchJobRepository.get_by_id(str(completed['id']))['status'] == 'completed'
@@ -1,7 +1,11 @@
 import os
 import uuid
+import json
+import base64
+import time
 from datetime import datetime
-from typing import Dict, Any
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, Optional
 
 def generate_unique_filename(original_filename: str) -> str:
     """Generate unique filename while preserving extension"""
@@ -49,3 +53,42 @@ def sanitize_filename(filename: str) -> str:
         filename = name[:255-len(ext)] + ext
     
     return filename
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Yield successive lists of at most size items"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def encode_cursor(*values) -> str:
+    """Encode pagination key values into an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Decode a cursor built by encode_cursor
+    Raises ValueError for malformed cursors
+    """
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID (version 7): 48-bit millisecond timestamp followed by random bits"""
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), 'big')
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+def parse_uuid(value) -> Optional[uuid.UUID]:
+    """Parse an id from a request or cursor, returning None if it is not a UUID"""
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
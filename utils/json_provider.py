@@ -0,0 +1,14 @@
+from flask.json.provider import DefaultJSONProvider
+import orjson
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (compact output, no key sorting)"""
+    
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    
+    def dumps(self, obj, **kwargs) -> str:
+        # Types orjson does not handle natively (Decimal, etc.) fall back to Flask's default
+        return orjson.dumps(obj, default=self.default, option=self.option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
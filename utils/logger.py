@@ -1,9 +1,42 @@
+import atexit
 import logging
+import os
+import queue
 import sys
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# Records are only queued by the logging call and written to the handlers by a listener
+# thread, so request threads do not wait on console and file writes.
+# {logger name: (listener, queue handler, loggers it was added to)} from setup_logger
+_listeners = {}
+
+def _stop_listener(name: str = None):
+    """Write out the records queued for a configured logger and stop its listener thread"""
+    entry = _listeners.pop(name, None)
+    if entry is not None:
+        entry[0].stop()
+
+def _stop_listeners():
+    """Flush and stop every listener when the process exits"""
+    for name in list(_listeners):
+        _stop_listener(name)
+
+def _write_directly_after_fork():
+    """Forked pool workers have no listener threads, so they write to the handlers themselves"""
+    for listener, queue_handler, loggers in _listeners.values():
+        for logger in loggers:
+            if queue_handler in logger.handlers:
+                logger.removeHandler(queue_handler)
+                for handler in listener.handlers:
+                    logger.addHandler(handler)
+    _listeners.clear()
+
+os.register_at_fork(after_in_child=_write_directly_after_fork)
+atexit.register(_stop_listeners)
 
 def setup_logger(name: str = None, level: int = logging.INFO) -> logging.Logger:
-    """Setup logger with console and file handlers"""
+    """Setup logger with console and file handlers, written from a background thread"""
     
     # If no name provided, configure the root logger
     if name is None:
@@ -12,8 +45,14 @@ def setup_logger(name: str = None, level: int = logging.INFO) -> logging.Logger:
         logger = logging.getLogger(name)
     
     logger.setLevel(level)
+
+    # The format below does not use thread or process fields, so records skip collecting them
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
     
     # Remove all handlers before adding new ones to avoid duplicate logs
+    _stop_listener(name)
     if logger.hasHandlers():
         logger.handlers.clear()
 
@@ -21,8 +60,8 @@ def setup_logger(name: str = None, level: int = logging.INFO) -> logging.Logger:
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
 
-    # File handler
-    file_handler = logging.FileHandler('app.log', mode='a', encoding='utf-8')
+    # File handler, opened on the first record it writes
+    file_handler = logging.FileHandler('app.log', mode='a', encoding='utf-8', delay=True)
     file_handler.setLevel(level)
 
     # Formatter
@@ -32,15 +71,21 @@ def setup_logger(name: str = None, level: int = logging.INFO) -> logging.Logger:
     console_handler.setFormatter(formatter)
     file_handler.setFormatter(formatter)
 
+    # Callers only enqueue records, the listener passes them on to both handlers
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    listener = QueueListener(queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    queued_loggers = [logger]
+    _listeners[name] = (listener, queue_handler, queued_loggers)
+
     # Add handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
     
     # Also set up Flask's logger
     flask_logger = logging.getLogger('werkzeug')
     flask_logger.setLevel(level)
     if not flask_logger.hasHandlers():
-        flask_logger.addHandler(console_handler)
-        flask_logger.addHandler(file_handler)
+        flask_logger.addHandler(queue_handler)
+        queued_loggers.append(flask_logger)
 
     return logger